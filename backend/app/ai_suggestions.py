@@ -1,7 +1,17 @@
+import asyncio
+import bisect
+import functools
+import hashlib
 import os
-from groq import Groq
+import threading
+import time
+import orjson
+from cachetools import TTLCache
+from groq import AsyncGroq
 from dotenv import load_dotenv
 
+from .classify import classify_severity
+
 # Load .env file from the backend directory
 env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
 load_dotenv(env_path)
@@ -10,27 +20,96 @@ api_key = os.environ.get("GROQ_API_KEY")
 if not api_key:
     print("Warning: GROQ_API_KEY not found in environment variables")
 
-client = Groq(
+aclient = AsyncGroq(
     api_key=api_key,
 )
 
-def get_remediation_suggestions(misconfiguration):
+MODEL = "llama-3.1-8b-instant"
+
+# Upper bound on in-flight Groq requests per bulk run (keeps us under rate limits)
+MAX_CONCURRENT_SUGGESTIONS = 8
+
+# Findings answered by one fused (multi-finding) request; each keeps the
+# single-request token budget, so this also bounds the response size
+FUSED_SUGGESTIONS_PER_REQUEST = 5
+
+# Batch API polling: exponential backoff between status checks
+BATCH_POLL_INITIAL_DELAY = 2
+BATCH_POLL_MAX_DELAY = 60
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# Confidence added to the 0.5 base score for each severity
+RISK_CONFIDENCE_BONUS = {"High": 0.4, "Medium": 0.2, "Low": 0.1}
+
+# Display category cut-offs: [0.8, 1] is high, [0.6, 0.8) medium, below that low
+_CONFIDENCE_CUTS = [0.6, 0.8]
+_CONFIDENCE_LABELS = ["low", "medium", "high"]
+
+# Prompts and cached answers never name the resource: it is sent as this
+# placeholder, and each finding's resource_id is filled into its own copy of the
+# answer. Findings that only differ by resource share one cached LLM answer
+# without one finding's (or account's) resource names leaking into another's.
+RESOURCE_PLACEHOLDER = "<RESOURCE_ID>"
+
+_suggestion_cache = TTLCache(maxsize=1024, ttl=86400)
+_suggestion_cache_lock = threading.Lock()
+
+# Fraction of new suggestions admitted to the cache (0-1). Lower values trade
+# repeat Groq calls for memory; admission is spread evenly with an accumulator.
+SUGGESTION_CACHE_ADMISSION_RATE = float(os.environ.get("SUGGESTION_CACHE_ADMISSION_RATE", "1.0"))
+_admission_accumulator = [0.0]
+
+def _agnostic_details(misconfiguration):
+    """The finding's details with its resource_id replaced by the placeholder"""
+    details = misconfiguration.get("details", "")
+    resource_id = misconfiguration.get("resource_id")
+    return details.replace(resource_id, RESOURCE_PLACEHOLDER) if resource_id else details
+
+def _personalize(suggestion, misconfiguration):
+    """Fill the finding's resource_id into a resource-agnostic suggestion"""
+    resource_id = misconfiguration.get("resource_id")
+    return suggestion.replace(RESOURCE_PLACEHOLDER, resource_id) if resource_id else suggestion
+
+def _cache_key(misconfiguration):
+    raw = misconfiguration.get("type", "") + "|" + _agnostic_details(misconfiguration)
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+def _cache_get(key):
+    with _suggestion_cache_lock:
+        return _suggestion_cache.get(key)
+
+def _cache_put(key, suggestion):
+    with _suggestion_cache_lock:
+        _admission_accumulator[0] += SUGGESTION_CACHE_ADMISSION_RATE
+        if _admission_accumulator[0] >= 1.0:
+            _admission_accumulator[0] -= 1.0
+            _suggestion_cache[key] = suggestion
+
+def _split_cached(configs):
     """
-    Generate AI-powered remediation suggestions for cloud misconfigurations
+    Look configs up in the suggestion cache. Returns each config's cache key,
+    the cached suggestions by key, and one config per uncached key.
     """
-    # Check if API key is available
-    if not api_key:
-        return {
-            "suggestion": "AI suggestions unavailable: GROQ_API_KEY not configured. Please set your Groq API key in the .env file.",
-            "confidence": "low"
-        }
-    
-    prompt = f"""
+    keys = [_cache_key(config) for config in configs]
+    by_key = {}
+    pending = {}
+    for key, config in zip(keys, configs):
+        cached = _cache_get(key)
+        if cached is not None:
+            by_key[key] = cached
+        else:
+            pending.setdefault(key, config)
+    return keys, by_key, pending
+
+# Remediation prompt, formatted with the misconfiguration's fields
+_PROMPT_TMPL = """
     You are a cloud security expert. Analyze this cloud misconfiguration and provide specific remediation guidance.
 
-    Issue: {misconfiguration['type']}
-    Resource: {misconfiguration['resource_id']}
-    Problem: {misconfiguration['details']}
+    Issue: {type}
+    Resource: {resource_id}
+    Problem: {details}
+
+    Refer to the resource only as {resource_id} (including in commands).
 
     Provide a structured response with:
 
@@ -49,23 +128,118 @@ def get_remediation_suggestions(misconfiguration):
     Keep it concise but actionable. Use bullet points and code blocks where helpful.
     """
 
+# Sampling parameters shared by every suggestion request
+_COMPLETION_PARAMS = {
+    "model": MODEL,
+    "temperature": 0.3,
+    "max_tokens": 1000,
+}
+
+class _PromptFields(dict):
+    """Misconfiguration fields for the prompt template; missing ones render empty"""
+    
+    def __missing__(self, key):
+        return ""
+
+def _prompt_fields(misconfiguration, **extra):
+    """Prompt fields with the resource replaced by the placeholder"""
+    return _PromptFields(
+        misconfiguration,
+        resource_id=RESOURCE_PLACEHOLDER,
+        details=_agnostic_details(misconfiguration),
+        **extra
+    )
+
+def _build_prompt(misconfiguration):
+    """Build the (resource-agnostic) remediation prompt for a single misconfiguration"""
+    return _PROMPT_TMPL.format_map(_prompt_fields(misconfiguration))
+
+# Fused prompt covering several misconfigurations, answered as one JSON object
+_FUSED_PROMPT_TMPL = """
+    You are a cloud security expert. Analyze each of these cloud misconfigurations and provide specific remediation guidance for each one.
+
+{items}
+    For each misconfiguration, write a structured response with:
+
+    🔍 SECURITY RISK:
+    [Brief explanation of why this is dangerous]
+
+    🛠️ IMMEDIATE FIX:
+    [Step-by-step remediation with specific commands]
+
+    ⚡ QUICK CLI COMMANDS:
+    [AWS CLI commands to fix this issue]
+
+    🔒 PREVENTION:
+    [Best practices to prevent this in the future]
+
+    Keep each one concise but actionable. Use bullet points and code blocks where helpful.
+    Refer to each resource only as <RESOURCE_ID> (including in commands).
+
+    Respond with a JSON object of the form {{"suggestions": [{{"index": <misconfiguration number>, "suggestion": "<response>"}}]}} with one entry per misconfiguration.
+    """
+
+_FUSED_ITEM_TMPL = """    Misconfiguration {index}:
+    Issue: {type}
+    Resource: {resource_id}
+    Problem: {details}
+"""
+
+def _build_fused_prompt(misconfigurations):
+    """Build one prompt asking for suggestions for every misconfiguration, numbered from 0"""
+    items = "\n".join(
+        _FUSED_ITEM_TMPL.format_map(_prompt_fields(misconfiguration, index=index))
+        for index, misconfiguration in enumerate(misconfigurations)
+    )
+    return _FUSED_PROMPT_TMPL.format(items=items)
+
+def _completion_body(prompt):
+    """Chat completion parameters shared by the interactive and batch paths"""
+    return {
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt,
+            }
+        ],
+        **_COMPLETION_PARAMS,
+    }
+
+def _suggestion_confidence(misconfiguration):
+    return "high" if classify_severity(misconfiguration['type']) == "High" else "medium"
+
+async def get_remediation_suggestions(misconfiguration):
+    """
+    Generate AI-powered remediation suggestions for cloud misconfigurations
+    """
+    result = await _fetch_suggestion(misconfiguration)
+    return {**result, "suggestion": _personalize(result["suggestion"], misconfiguration)}
+
+async def _fetch_suggestion(misconfiguration):
+    """Resource-agnostic suggestion for a misconfiguration (cached by _cache_key)"""
+    # Check if API key is available
+    if not api_key:
+        return {
+            "suggestion": "AI suggestions unavailable: GROQ_API_KEY not configured. Please set your Groq API key in the .env file.",
+            "confidence": "low"
+        }
+    
+    key = _cache_key(misconfiguration)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    prompt = _build_prompt(misconfiguration)
+
     try:
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                }
-            ],
-            model="llama-3.1-8b-instant",
-            temperature=0.3,
-            max_tokens=1000,
-        )
+        chat_completion = await aclient.chat.completions.create(**_completion_body(prompt))
         
-        return {
+        result = {
             "suggestion": chat_completion.choices[0].message.content,
-            "confidence": "high" if "public" in misconfiguration['type'].lower() or "unrestricted" in misconfiguration['type'].lower() else "medium"
+            "confidence": _suggestion_confidence(misconfiguration)
         }
+        _cache_put(key, result)
+        return result
     
     except Exception as e:
         print(f"Error calling Groq API: {str(e)}")
@@ -78,16 +252,13 @@ def calculate_confidence_score(misconfiguration, strictness_level="balanced"):
     """
     Calculate confidence score based on issue characteristics and strictness level
     """
-    base_score = 0.5
-    issue_type = misconfiguration.get("type", "").lower()
-    
-    # Risk-based scoring
-    if "public" in issue_type or "unrestricted" in issue_type:
-        base_score += 0.4  # High risk = high confidence
-    elif "permissive" in issue_type or "iam" in issue_type:
-        base_score += 0.2  # Medium risk
-    else:
-        base_score += 0.1  # Low risk
+    return _score(misconfiguration.get("type", ""), strictness_level)
+
+# Scores only depend on the issue type, and scans repeat a handful of types
+@functools.lru_cache(maxsize=128)
+def _score(issue_type, strictness_level):
+    # Risk-based scoring: high risk = high confidence
+    base_score = 0.5 + RISK_CONFIDENCE_BONUS[classify_severity(issue_type)]
     
     # Strictness adjustments
     if strictness_level == "strict":
@@ -98,34 +269,245 @@ def calculate_confidence_score(misconfiguration, strictness_level="balanced"):
     # Ensure score is between 0 and 1
     return min(max(base_score, 0.0), 1.0)
 
-def get_bulk_suggestions(misconfigurations, ai_confidence_threshold=0.7, strictness_level="balanced"):
+def _filter_by_confidence(misconfigurations, ai_confidence_threshold, strictness_level):
+    """Pair each misconfiguration with its confidence score, dropping those below threshold"""
+    # Scans contain a handful of issue types, so score each type once up front
+    issue_types = {config.get("type", "") for config in misconfigurations}
+    score_by_type = {issue_type: _score(issue_type, strictness_level) for issue_type in issue_types}
+    
+    filtered = []
+    for config in misconfigurations:
+        confidence_score = score_by_type[config.get("type", "")]
+        if confidence_score >= ai_confidence_threshold:
+            filtered.append((config, confidence_score))
+    return filtered
+
+def _build_results(filtered, results, strictness_level):
+    """Merge AI suggestions back into their misconfigurations"""
+    suggestions = []
+    for (config, confidence_score), suggestion in zip(filtered, results):
+        # Shallow copy: scan results (and the scanner's mock findings) are shared
+        out = dict(config)
+        out["ai_suggestion"] = _personalize(suggestion["suggestion"], config)
+        # Convert to categorical confidence for display (a score on a cut goes up)
+        out["confidence"] = _CONFIDENCE_LABELS[bisect.bisect_right(_CONFIDENCE_CUTS, confidence_score)]
+        out["confidence_score"] = round(confidence_score, 2)
+        out["strictness_level"] = strictness_level
+        suggestions.append(out)
+    return suggestions
+
+def _schedule_suggestions(configs):
     """
-    Generate suggestions for multiple misconfigurations with confidence filtering
+    Start a bounded, concurrent Groq request per config and return one task per
+    config (in input order). Configs that share a cache key share one task.
     """
-    suggestions = []
-    for config in misconfigurations:
-        # Calculate numeric confidence score
-        confidence_score = calculate_confidence_score(config, strictness_level)
-        
-        # Skip if below threshold
-        if confidence_score < ai_confidence_threshold:
+    sem = asyncio.Semaphore(MAX_CONCURRENT_SUGGESTIONS)
+
+    async def _one(config):
+        async with sem:
+            return await _fetch_suggestion(config)
+
+    tasks_by_key = {}
+    tasks = []
+    for config in configs:
+        key = _cache_key(config)
+        if key not in tasks_by_key:
+            tasks_by_key[key] = asyncio.ensure_future(_one(config))
+        tasks.append(tasks_by_key[key])
+    return tasks
+
+async def _fetch_concurrently(configs):
+    """Request suggestions for each config concurrently, preserving input order"""
+    return await asyncio.gather(*_schedule_suggestions(configs))
+
+async def _fused_suggestions(configs):
+    """
+    Request suggestions for several configs in a single JSON-mode Groq call.
+    Returns one suggestion per config, or None where the response has no usable answer.
+    """
+    body = _completion_body(_build_fused_prompt(configs))
+    body["max_tokens"] = _COMPLETION_PARAMS["max_tokens"] * len(configs)
+    body["response_format"] = {"type": "json_object"}
+
+    try:
+        chat_completion = await aclient.chat.completions.create(**body)
+        entries = orjson.loads(chat_completion.choices[0].message.content)["suggestions"]
+    except Exception as e:
+        print(f"Error calling Groq API for fused suggestions: {str(e)}")
+        return [None] * len(configs)
+
+    results = [None] * len(configs)
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
             continue
-            
-        suggestion = get_remediation_suggestions(config)
-        
-        # Convert to categorical confidence for display
-        if confidence_score >= 0.8:
-            confidence_category = "high"
-        elif confidence_score >= 0.6:
-            confidence_category = "medium"
-        else:
-            confidence_category = "low"
-        
-        suggestions.append({
-            **config,
-            "ai_suggestion": suggestion["suggestion"],
-            "confidence": confidence_category,
-            "confidence_score": round(confidence_score, 2),
-            "strictness_level": strictness_level
-        })
-    return suggestions
\ No newline at end of file
+        index = entry.get("index")
+        suggestion = entry.get("suggestion")
+        if isinstance(index, int) and 0 <= index < len(configs) and isinstance(suggestion, str) and suggestion:
+            results[index] = {
+                "suggestion": suggestion,
+                "confidence": _suggestion_confidence(configs[index])
+            }
+    return results
+
+async def get_remediation_suggestions_batch(misconfigurations):
+    """
+    Generate suggestions for several misconfigurations, fusing up to
+    FUSED_SUGGESTIONS_PER_REQUEST of them into each Groq request. Findings the
+    fused responses don't answer are retried one at a time. Keeps input order.
+    Suggestions still contain RESOURCE_PLACEHOLDER; _build_results fills it in.
+    """
+    if not api_key:
+        return await _fetch_concurrently(misconfigurations)
+
+    keys, by_key, pending = _split_cached(misconfigurations)
+    pending_keys = list(pending)
+    chunks = [
+        pending_keys[start:start + FUSED_SUGGESTIONS_PER_REQUEST]
+        for start in range(0, len(pending_keys), FUSED_SUGGESTIONS_PER_REQUEST)
+    ]
+    sem = asyncio.Semaphore(MAX_CONCURRENT_SUGGESTIONS)
+
+    async def _chunk(chunk_keys):
+        async with sem:
+            return await _fused_suggestions([pending[key] for key in chunk_keys])
+
+    for chunk_keys, suggestions in zip(chunks, await asyncio.gather(*(_chunk(c) for c in chunks))):
+        for key, suggestion in zip(chunk_keys, suggestions):
+            if suggestion is not None:
+                _cache_put(key, suggestion)
+                by_key[key] = suggestion
+
+    missing = [key for key in pending_keys if key not in by_key]
+    if missing:
+        fallback = await _fetch_concurrently([pending[key] for key in missing])
+        by_key.update(zip(missing, fallback))
+
+    return [by_key[key] for key in keys]
+
+async def _run_batch(configs, deadline_seconds):
+    """
+    Submit one Groq Batch API job for all configs and wait for it to finish.
+    Returns a dict of index -> suggestion for the requests that succeeded, or
+    None if the batch could not be submitted or did not complete in time.
+    """
+    lines = []
+    for index, config in enumerate(configs):
+        lines.append(orjson.dumps({
+            # resource_id alone isn't unique (a bucket can have ACL and policy findings)
+            "custom_id": f"{index}:{config['resource_id']}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": _completion_body(_build_prompt(config)),
+        }))
+
+    try:
+        batch_file = await aclient.files.create(
+            file=("suggestions.jsonl", b"\n".join(lines)),
+            purpose="batch",
+        )
+        batch = await aclient.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+
+        deadline = time.monotonic() + deadline_seconds
+        delay = BATCH_POLL_INITIAL_DELAY
+        while batch.status not in BATCH_TERMINAL_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"Groq batch {batch.id} not done within {deadline_seconds}s, cancelling")
+                await aclient.batches.cancel(batch.id)
+                return None
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, BATCH_POLL_MAX_DELAY)
+            batch = await aclient.batches.retrieve(batch.id)
+
+        if batch.status != "completed" or not batch.output_file_id:
+            print(f"Groq batch {batch.id} finished with status {batch.status}")
+            return None
+
+        output = await aclient.files.content(batch.output_file_id)
+        output_text = await output.text()
+    except Exception as e:
+        print(f"Error running Groq batch: {str(e)}")
+        return None
+
+    results = {}
+    for line in output_text.splitlines():
+        if not line.strip():
+            continue
+        # A malformed record only loses its own result; that finding falls back
+        try:
+            record = orjson.loads(line)
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                continue
+            index = int(record["custom_id"].split(":", 1)[0])
+            if not 0 <= index < len(configs):
+                continue
+            suggestion = response["body"]["choices"][0]["message"]["content"]
+        except (orjson.JSONDecodeError, AttributeError, KeyError, IndexError, TypeError, ValueError) as e:
+            print(f"Skipping malformed Groq batch record: {str(e)}")
+            continue
+        results[index] = {
+            "suggestion": suggestion,
+            "confidence": _suggestion_confidence(configs[index])
+        }
+    return results
+
+async def get_bulk_suggestions(misconfigurations, ai_confidence_threshold=0.7, strictness_level="balanced"):
+    """
+    Generate suggestions for multiple misconfigurations with confidence filtering.
+    Findings above the threshold are sent to Groq several at a time in fused requests.
+    """
+    filtered = _filter_by_confidence(misconfigurations, ai_confidence_threshold, strictness_level)
+    results = await get_remediation_suggestions_batch([config for config, _ in filtered])
+    return _build_results(filtered, results, strictness_level)
+
+async def iter_bulk_suggestions(misconfigurations, ai_confidence_threshold=0.7, strictness_level="balanced"):
+    """
+    Like get_bulk_suggestions, but yields each finding as soon as its suggestion
+    is ready (completion order rather than input order).
+    """
+    filtered = _filter_by_confidence(misconfigurations, ai_confidence_threshold, strictness_level)
+    tasks = _schedule_suggestions([config for config, _ in filtered])
+
+    async def _result(item, task):
+        return _build_results([item], [await task], strictness_level)[0]
+
+    try:
+        for next_result in asyncio.as_completed([_result(item, task) for item, task in zip(filtered, tasks)]):
+            yield await next_result
+    finally:
+        # The consumer may stop early (e.g. client disconnected)
+        for task in tasks:
+            task.cancel()
+
+async def get_bulk_suggestions_batch(misconfigurations, ai_confidence_threshold=0.7,
+                                     strictness_level="balanced", deadline_seconds=600):
+    """
+    Generate suggestions for non-interactive (automated) scans via the Groq Batch API.
+    Falls back to concurrent requests if the batch fails or misses the deadline.
+    """
+    filtered = _filter_by_confidence(misconfigurations, ai_confidence_threshold, strictness_level)
+    configs = [config for config, _ in filtered]
+    if not configs or not api_key:
+        return await get_bulk_suggestions(misconfigurations, ai_confidence_threshold, strictness_level)
+
+    keys, by_key, pending = _split_cached(configs)
+    if pending:
+        pending_keys = list(pending)
+        batch_results = await _run_batch(list(pending.values()), deadline_seconds) or {}
+        for index, suggestion in batch_results.items():
+            _cache_put(pending_keys[index], suggestion)
+            by_key[pending_keys[index]] = suggestion
+
+        # Anything the batch didn't answer goes through the interactive path
+        missing = [key for key in pending_keys if key not in by_key]
+        if missing:
+            fallback = await get_remediation_suggestions_batch([pending[key] for key in missing])
+            by_key.update(zip(missing, fallback))
+
+    results = [by_key[key] for key in keys]
+    return _build_results(filtered, results, strictness_level)
@@ -1,20 +1,153 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
-from collections import defaultdict, Counter
-import json
+from collections import Counter
+import os
+import sqlite3
+import threading
+import hashlib
+import orjson
+from cachetools.func import ttl_cache
 
-# In-memory storage for analytics (in production, use proper database)
-scan_history = []
-remediation_history = []
+from .classify import classify_service, classify_severity
+
+# Analytics history is stored in SQLite (in-memory unless ANALYTICS_DB_PATH points
+# at a file). Per-scan service/severity/finding rows carry the scan's day so the
+# dashboard aggregations are indexed GROUP BY queries over the requested window.
+ANALYTICS_DB_PATH = os.environ.get("ANALYTICS_DB_PATH", ":memory:")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    day TEXT NOT NULL,
+    user TEXT NOT NULL,
+    scan_type TEXT NOT NULL,
+    total_issues INTEGER NOT NULL,
+    issues_by_service TEXT NOT NULL,
+    issues_by_severity TEXT NOT NULL,
+    scan_duration_ms INTEGER NOT NULL,
+    findings TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_scans_day ON scans (day);
+
+CREATE TABLE IF NOT EXISTS scan_service_counts (
+    scan_id INTEGER NOT NULL REFERENCES scans (id),
+    day TEXT NOT NULL,
+    service TEXT NOT NULL,
+    cnt INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_scan_service_counts_day ON scan_service_counts (day);
+
+CREATE TABLE IF NOT EXISTS scan_severity_counts (
+    scan_id INTEGER NOT NULL REFERENCES scans (id),
+    day TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    cnt INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_scan_severity_counts_day ON scan_severity_counts (day);
+
+CREATE TABLE IF NOT EXISTS findings (
+    scan_id INTEGER NOT NULL REFERENCES scans (id),
+    day TEXT NOT NULL,
+    type TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_findings_day ON findings (day);
+
+CREATE TABLE IF NOT EXISTS remediations (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    day TEXT NOT NULL,
+    user TEXT NOT NULL,
+    issue_id TEXT NOT NULL,
+    action TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    time_to_remediation_hours REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_remediations_day ON remediations (day);
+"""
+
+# One shared connection; sqlite3 connections aren't safe for concurrent use, so
+# every access goes through the lock
+_db = sqlite3.connect(ANALYTICS_DB_PATH, check_same_thread=False)
+_db_lock = threading.Lock()
+with _db_lock:
+    _db.execute("PRAGMA journal_mode=WAL")
+    _db.executescript(_SCHEMA)
+
+def _window_start(days: int) -> str:
+    """First ISO date of the window; after today when days <= 0, so no record matches"""
+    return (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+
+def _window_days(days: int) -> List[str]:
+    """ISO dates covered by the window, oldest first (today included)"""
+    today = datetime.utcnow().date()
+    return [(today - timedelta(days=i)).isoformat() for i in range(days - 1, -1, -1)]
+
+def _insert_scan(scan_record: Dict, day: str) -> int:
+    """Insert a scan (without id) and its aggregation rows in one transaction"""
+    with _db_lock, _db:
+        scan_id = _db.execute(
+            "INSERT INTO scans (timestamp, day, user, scan_type, total_issues, issues_by_service,"
+            " issues_by_severity, scan_duration_ms, findings) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                scan_record["timestamp"], day, scan_record["user"], scan_record["scan_type"],
+                scan_record["total_issues"], orjson.dumps(scan_record["issues_by_service"]),
+                orjson.dumps(scan_record["issues_by_severity"]), scan_record["scan_duration_ms"],
+                orjson.dumps(scan_record["findings"])
+            )
+        ).lastrowid
+        _db.executemany(
+            "INSERT INTO scan_service_counts (scan_id, day, service, cnt) VALUES (?, ?, ?, ?)",
+            [(scan_id, day, service, cnt) for service, cnt in scan_record["issues_by_service"].items()]
+        )
+        _db.executemany(
+            "INSERT INTO scan_severity_counts (scan_id, day, severity, cnt) VALUES (?, ?, ?, ?)",
+            [(scan_id, day, severity, cnt) for severity, cnt in scan_record["issues_by_severity"].items()]
+        )
+        _db.executemany(
+            "INSERT INTO findings (scan_id, day, type) VALUES (?, ?, ?)",
+            [(scan_id, day, finding.get("type", "Unknown")) for finding in scan_record["findings"]]
+        )
+    return scan_id
+
+def _insert_remediation(remediation_record: Dict, day: str) -> int:
+    """Insert a remediation (without id)"""
+    with _db_lock, _db:
+        return _db.execute(
+            "INSERT INTO remediations (timestamp, day, user, issue_id, action, success,"
+            " time_to_remediation_hours) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                remediation_record["timestamp"], day, remediation_record["user"],
+                remediation_record["issue_id"], remediation_record["action"],
+                int(remediation_record["success"]), remediation_record["time_to_remediation_hours"]
+            )
+        ).lastrowid
+
+def _query(sql: str, params=()) -> List[tuple]:
+    with _db_lock:
+        return _db.execute(sql, params).fetchall()
+
+def _dashboard_key(days: int) -> tuple:
+    """Everything the dashboard result depends on: the window and the newest records"""
+    last_scan_id, last_remediation_id = _query(
+        "SELECT (SELECT MAX(id) FROM scans), (SELECT MAX(id) FROM remediations)"
+    )[0]
+    return days, last_scan_id, last_remediation_id, datetime.utcnow().date().isoformat()
+
+# Dashboard polling hits the same key over and over; new scans/remediations (or a
+# new day) change the key, so the TTL only bounds memory, not staleness
+@ttl_cache(maxsize=8, ttl=30)
+def _compute_dashboard(days: int, last_scan_id, last_remediation_id, today: str) -> Dict[str, Any]:
+    return AnalyticsService.get_dashboard_metrics(days)
 
 class AnalyticsService:
     
     @staticmethod
     def record_scan(user: str, misconfigurations: List[Dict], scan_type: str = "manual"):
         """Record a scan event for analytics"""
+        now = datetime.utcnow()
         scan_record = {
-            "id": len(scan_history) + 1,
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": now.isoformat(),
             "user": user,
             "scan_type": scan_type,
             "total_issues": len(misconfigurations),
@@ -23,64 +156,54 @@ class AnalyticsService:
             "scan_duration_ms": 1500,  # Mock duration
             "findings": misconfigurations
         }
-        scan_history.append(scan_record)
-        return scan_record["id"]
+        return _insert_scan(scan_record, now.date().isoformat())
     
     @staticmethod
     def record_remediation(user: str, issue_id: str, action: str, success: bool):
         """Record a remediation action"""
+        now = datetime.utcnow()
         remediation_record = {
-            "id": len(remediation_history) + 1,
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": now.isoformat(),
             "user": user,
             "issue_id": issue_id,
             "action": action,
             "success": success,
             "time_to_remediation_hours": 0.5  # Mock time
         }
-        remediation_history.append(remediation_record)
-        return remediation_record["id"]
+        return _insert_remediation(remediation_record, now.date().isoformat())
     
     @staticmethod
     def get_dashboard_metrics(days: int = 30) -> Dict[str, Any]:
         """Get comprehensive dashboard metrics"""
-        cutoff_date = datetime.utcnow() - timedelta(days=days)
-        recent_scans = [
-            scan for scan in scan_history 
-            if datetime.fromisoformat(scan["timestamp"]) > cutoff_date
-        ]
-        recent_remediations = [
-            rem for rem in remediation_history 
-            if datetime.fromisoformat(rem["timestamp"]) > cutoff_date
-        ]
+        window = _window_days(days)
+        since = _window_start(days)
         
         # Calculate metrics
-        total_scans = len(recent_scans)
-        total_issues = sum(scan["total_issues"] for scan in recent_scans)
-        total_remediations = len(recent_remediations)
-        successful_remediations = len([r for r in recent_remediations if r["success"]])
+        total_scans, total_issues = _query(
+            "SELECT COUNT(*), COALESCE(SUM(total_issues), 0) FROM scans WHERE day >= ?", (since,)
+        )[0]
+        total_remediations, successful_remediations, avg_remediation_time = _query(
+            "SELECT COUNT(*), COALESCE(SUM(success), 0), COALESCE(AVG(time_to_remediation_hours), 0)"
+            " FROM remediations WHERE day >= ?", (since,)
+        )[0]
         
-        # Service breakdown
-        service_metrics = defaultdict(lambda: {"issues": 0, "scans": 0})
-        for scan in recent_scans:
-            for service, count in scan["issues_by_service"].items():
-                service_metrics[service]["issues"] += count
-                service_metrics[service]["scans"] += 1
+        # Service breakdown (one row per scan per service, so COUNT(*) = scans)
+        service_metrics = {
+            service: {"issues": issues, "scans": scans}
+            for service, issues, scans in _query(
+                "SELECT service, SUM(cnt), COUNT(*) FROM scan_service_counts WHERE day >= ?"
+                " GROUP BY service ORDER BY MIN(rowid)", (since,)
+            )
+        }
         
         # Severity breakdown
-        severity_metrics = defaultdict(int)
-        for scan in recent_scans:
-            for severity, count in scan["issues_by_severity"].items():
-                severity_metrics[severity] += count
+        severity_metrics = dict(_query(
+            "SELECT severity, SUM(cnt) FROM scan_severity_counts WHERE day >= ?"
+            " GROUP BY severity ORDER BY MIN(rowid)", (since,)
+        ))
         
         # Time series data for charts
-        daily_metrics = AnalyticsService._get_daily_metrics(recent_scans, days)
-        
-        # Average remediation time
-        avg_remediation_time = (
-            sum(r["time_to_remediation_hours"] for r in recent_remediations) / 
-            len(recent_remediations) if recent_remediations else 0
-        )
+        daily_metrics = AnalyticsService._get_daily_metrics(window, since)
         
         return {
             "overview": {
@@ -94,77 +217,84 @@ class AnalyticsService:
                 "avg_remediation_time_hours": round(avg_remediation_time, 2),
                 "avg_issues_per_scan": round(total_issues / total_scans, 1) if total_scans > 0 else 0
             },
-            "service_breakdown": dict(service_metrics),
-            "severity_breakdown": dict(severity_metrics),
+            "service_breakdown": service_metrics,
+            "severity_breakdown": severity_metrics,
             "time_series": daily_metrics,
-            "recent_scans": recent_scans[-10:],  # Last 10 scans
-            "top_issues": AnalyticsService._get_top_issues(recent_scans)
+            "recent_scans": AnalyticsService._get_recent_scans(since),
+            "top_issues": AnalyticsService._get_top_issues(since)
         }
     
+    @staticmethod
+    def get_cached_dashboard_metrics(days: int = 30, if_none_match: Optional[str] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Get dashboard metrics and their ETag; metrics are None when the client's copy is current"""
+        key = _dashboard_key(days)
+        etag = '"' + hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest() + '"'
+        if if_none_match == etag:
+            return etag, None
+        return etag, _compute_dashboard(*key)
+    
     @staticmethod
     def _categorize_by_service(misconfigurations: List[Dict]) -> Dict[str, int]:
         """Categorize issues by AWS service"""
-        service_count = defaultdict(int)
-        for issue in misconfigurations:
-            issue_type = issue.get("type", "")
-            if "S3" in issue_type:
-                service_count["S3"] += 1
-            elif "IAM" in issue_type:
-                service_count["IAM"] += 1
-            elif "Security Group" in issue_type:
-                service_count["EC2"] += 1
-            else:
-                service_count["Other"] += 1
-        return dict(service_count)
+        return dict(Counter(classify_service(issue.get("type", "")) for issue in misconfigurations))
     
     @staticmethod
     def _categorize_by_severity(misconfigurations: List[Dict]) -> Dict[str, int]:
         """Categorize issues by severity"""
-        severity_count = defaultdict(int)
-        for issue in misconfigurations:
-            issue_type = issue.get("type", "")
-            if "Public" in issue_type or "Unrestricted" in issue_type:
-                severity_count["High"] += 1
-            elif "IAM" in issue_type or "Permissive" in issue_type:
-                severity_count["Medium"] += 1
-            else:
-                severity_count["Low"] += 1
-        return dict(severity_count)
+        return dict(Counter(classify_severity(issue.get("type", "")) for issue in misconfigurations))
     
     @staticmethod
-    def _get_daily_metrics(scans: List[Dict], days: int) -> List[Dict]:
+    def _get_daily_metrics(window: List[str], since: str) -> List[Dict]:
         """Get daily metrics for time series charts"""
-        daily_data = defaultdict(lambda: {"scans": 0, "issues": 0})
-        
-        for scan in scans:
-            date = datetime.fromisoformat(scan["timestamp"]).date().isoformat()
-            daily_data[date]["scans"] += 1
-            daily_data[date]["issues"] += scan["total_issues"]
-        
-        # Fill in missing days with zeros
-        result = []
-        for i in range(days):
-            date = (datetime.utcnow() - timedelta(days=i)).date().isoformat()
-            result.append({
-                "date": date,
-                "scans": daily_data[date]["scans"],
-                "issues": daily_data[date]["issues"]
-            })
-        
-        return sorted(result, key=lambda x: x["date"])
+        daily = {
+            day: (scans, issues)
+            for day, scans, issues in _query(
+                "SELECT day, COUNT(*), SUM(total_issues) FROM scans WHERE day >= ? GROUP BY day",
+                (since,)
+            )
+        }
+        return [
+            {
+                "date": day,
+                "scans": daily.get(day, (0, 0))[0],
+                "issues": daily.get(day, (0, 0))[1]
+            }
+            for day in window
+        ]
     
     @staticmethod
-    def _get_top_issues(scans: List[Dict]) -> List[Dict]:
+    def _get_recent_scans(since: str, limit: int = 10) -> List[Dict]:
+        """Get the most recent scans since the given day, oldest first"""
+        rows = _query(
+            "SELECT id, timestamp, user, scan_type, total_issues, issues_by_service, issues_by_severity,"
+            " scan_duration_ms, findings FROM scans WHERE day >= ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (since, limit)
+        )
+        return [
+            {
+                "id": scan_id,
+                "timestamp": timestamp,
+                "user": user,
+                "scan_type": scan_type,
+                "total_issues": total_issues,
+                "issues_by_service": orjson.loads(issues_by_service),
+                "issues_by_severity": orjson.loads(issues_by_severity),
+                "scan_duration_ms": scan_duration_ms,
+                "findings": orjson.loads(findings)
+            }
+            for (scan_id, timestamp, user, scan_type, total_issues, issues_by_service,
+                 issues_by_severity, scan_duration_ms, findings) in reversed(rows)
+        ]
+    
+    @staticmethod
+    def _get_top_issues(since: str) -> List[Dict]:
         """Get most common issue types"""
-        issue_types = []
-        for scan in scans:
-            for finding in scan.get("findings", []):
-                issue_types.append(finding.get("type", "Unknown"))
-        
-        counter = Counter(issue_types)
         return [
             {"type": issue_type, "count": count} 
-            for issue_type, count in counter.most_common(10)
+            for issue_type, count in _query(
+                "SELECT type, COUNT(*) AS count FROM findings WHERE day >= ?"
+                " GROUP BY type ORDER BY count DESC, MIN(rowid) LIMIT 10", (since,)
+            )
         ]
 
 # Add some mock data for demonstration
@@ -175,12 +305,12 @@ def populate_mock_analytics():
         {"type": "Overly Permissive IAM Role", "resource_id": "role-1", "details": "Admin access"},
         {"type": "Unrestricted Security Group", "resource_id": "sg-1", "details": "0.0.0.0/0 access"}
     ]
+    now = datetime.utcnow()
     
     # Create some historical data
     for i in range(15):
-        days_ago = datetime.utcnow() - timedelta(days=i)
+        days_ago = now - timedelta(days=i)
         scan_record = {
-            "id": i + 1,
             "timestamp": days_ago.isoformat(),
             "user": "admin" if i % 3 == 0 else "security_analyst",
             "scan_type": "automated" if i % 4 == 0 else "manual",
@@ -190,13 +320,12 @@ def populate_mock_analytics():
             "scan_duration_ms": 1200 + (i * 100),
             "findings": mock_misconfigs
         }
-        scan_history.append(scan_record)
+        _insert_scan(scan_record, days_ago.date().isoformat())
     
     # Create some remediation data
     for i in range(8):
-        days_ago = datetime.utcnow() - timedelta(days=i, hours=i*2)
+        days_ago = now - timedelta(days=i, hours=i*2)
         remediation_record = {
-            "id": i + 1,
             "timestamp": days_ago.isoformat(),
             "user": "admin",
             "issue_id": f"issue-{i+1}",
@@ -204,7 +333,9 @@ def populate_mock_analytics():
             "success": i % 4 != 0,  # 75% success rate
             "time_to_remediation_hours": 0.5 + (i * 0.3)
         }
-        remediation_history.append(remediation_record)
+        _insert_remediation(remediation_record, days_ago.date().isoformat())
 
-# Initialize with mock data
-populate_mock_analytics()
\ No newline at end of file
+# Initialize with mock data for local demos only, so production workers start
+# with empty history
+if os.environ.get("ENABLE_MOCK_ANALYTICS") == "1":
+    populate_mock_analytics()
\ No newline at end of file
@@ -3,20 +3,83 @@ from typing import Optional
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
+import base64
+import bcrypt
+import hashlib
+import hmac
 import jwt
+import orjson
 import os
-from datetime import datetime, timedelta
+import threading
+import time
+from cachetools import LRUCache, TTLCache
 
 # Simple JWT secret (in production, use proper key management)
 JWT_SECRET = os.environ.get("JWT_SECRET", "your-secret-key-change-in-production")
 JWT_ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_SECONDS = 24 * 60 * 60
 
 security = HTTPBearer()
 
+# HS256 tokens are built and checked directly: the header never changes, and the
+# HMAC is keyed once and copied per token. Output matches PyJWT's, and PyJWT's
+# exception types are raised so callers handle errors the same way.
+_HEADER_B64 = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b"=")
+_HMAC_SEED = hmac.new(JWT_SECRET.encode(), digestmod=hashlib.sha256)
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+def _sign(signing_input: bytes) -> bytes:
+    mac = _HMAC_SEED.copy()
+    mac.update(signing_input)
+    return mac.digest()
+
+def _encode_token(payload: dict) -> str:
+    signing_input = _HEADER_B64 + b"." + _b64encode(orjson.dumps(payload))
+    return (signing_input + b"." + _b64encode(_sign(signing_input))).decode()
+
+def _decode_token(token: str) -> dict:
+    """Verify an HS256 token's signature and expiry and return its payload"""
+    try:
+        signing_input, signature = token.encode().rsplit(b".", 1)
+        header_b64, payload_b64 = signing_input.split(b".")
+        header = orjson.loads(_b64decode(header_b64))
+        payload = orjson.loads(_b64decode(payload_b64))
+        signature = _b64decode(signature)
+    except (ValueError, orjson.JSONDecodeError) as e:
+        raise jwt.DecodeError(f"Malformed token: {e}")
+    
+    if not isinstance(header, dict) or header.get("alg") != JWT_ALGORITHM:
+        raise jwt.InvalidAlgorithmError("The specified alg value is not allowed")
+    if not hmac.compare_digest(_sign(signing_input), signature):
+        raise jwt.InvalidSignatureError("Signature verification failed")
+    if not isinstance(payload, dict):
+        raise jwt.DecodeError("Invalid payload")
+    
+    exp = payload.get("exp")
+    if exp is not None:
+        if not isinstance(exp, (int, float)):
+            raise jwt.DecodeError("Expiration Time claim (exp) must be an integer.")
+        if exp <= time.time():
+            raise jwt.ExpiredSignatureError("Signature has expired")
+    return payload
+
+# Verified tokens -> (exp, User), so repeat requests with the same bearer token
+# skip signature verification until the token expires
+_token_cache = TTLCache(maxsize=10_000, ttl=3600)
+_token_cache_lock = threading.Lock()
+
 class UserRole(str, Enum):
     ADMIN = "admin"
     VIEWER = "viewer"
 
+# Token role claim -> UserRole; a dict probe is cheaper than Enum's value lookup
+_ROLE_BY_VALUE = {role.value: role for role in UserRole}
+
 class User(BaseModel):
     username: str
     role: UserRole
@@ -26,33 +89,75 @@ class LoginRequest(BaseModel):
     username: str
     password: str
 
-# Mock user database (in production, use proper database)
+# Mock user database (in production, use proper database); only bcrypt hashes
+# (cost 12) are kept, precomputed so importing the module doesn't run the KDF
 MOCK_USERS = {
-    "admin": {"password": "admin123", "role": UserRole.ADMIN, "email": "admin@company.com"},
-    "viewer": {"password": "viewer123", "role": UserRole.VIEWER, "email": "viewer@company.com"},
-    "security_analyst": {"password": "analyst123", "role": UserRole.VIEWER, "email": "analyst@company.com"}
+    "admin": {"pwhash": b"$2b$12$e5ihAmq02GFbu9.xW2OT6u8Dv6de/NEwcdsMYU8Js1nKY3SFXUT9S", "role": UserRole.ADMIN, "email": "admin@company.com"},
+    "viewer": {"pwhash": b"$2b$12$lyAjdIdxgkoJLJj.W30rOe05XCqVSUEIKPTBpBdbpvl9Xoe4.rF9i", "role": UserRole.VIEWER, "email": "viewer@company.com"},
+    "security_analyst": {"pwhash": b"$2b$12$eBGMSkJlVDmnhU3sffssn.kpBR69tfleyc0.2RSbEdxlazcHnYZeu", "role": UserRole.VIEWER, "email": "analyst@company.com"}
 }
 
+# Checked against for unknown usernames so they cost the same as a wrong password
+_DUMMY_HASH = b"$2b$12$JDg5/XY.tFK05k6Dr5N7xubNtAvVJHs6UHe836BIZ3Ji1vTcGAZUu"
+
+# Successful bcrypt checks, keyed by (username, stored hash, keyed digest of the
+# password), so repeat logins skip the KDF. Only successes are cached: wrong
+# passwords and unknown users always pay the full bcrypt cost. The digest key
+# is random per process, so the cache never holds a reusable password hash.
+_verified_logins = LRUCache(maxsize=256)
+_verified_logins_lock = threading.Lock()
+_LOGIN_DIGEST_KEY = os.urandom(32)
+
+def _bcrypt_matches(password: str, pwhash: bytes) -> bool:
+    # bcrypt >= 5 raises for passwords over 72 bytes instead of truncating them
+    try:
+        return bcrypt.checkpw(password.encode(), pwhash)
+    except ValueError:
+        return False
+
+def _check_password(username: str, password: str, pwhash: bytes) -> bool:
+    digest = hmac.new(_LOGIN_DIGEST_KEY, password.encode(), hashlib.sha256).digest()
+    key = (username, pwhash, digest)
+    with _verified_logins_lock:
+        if key in _verified_logins:
+            return True
+    
+    if not _bcrypt_matches(password, pwhash):
+        return False
+    with _verified_logins_lock:
+        _verified_logins[key] = True
+    return True
+
 def create_access_token(username: str, role: UserRole) -> str:
     """Create JWT access token"""
     payload = {
         "sub": username,
         "role": role.value,
-        "exp": datetime.utcnow() + timedelta(hours=24)
+        "exp": int(time.time()) + ACCESS_TOKEN_EXPIRE_SECONDS
     }
-    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    return _encode_token(payload)
 
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
     """Verify JWT token and return user"""
+    token = credentials.credentials
+    with _token_cache_lock:
+        cached = _token_cache.get(token)
+    if cached and cached[0] > time.time():
+        return cached[1]
+    
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = _decode_token(token)
         username = payload.get("sub")
         role = payload.get("role")
         
         if username is None or role is None:
             raise HTTPException(status_code=401, detail="Invalid token")
         
-        return User(username=username, role=UserRole(role))
+        user = User(username=username, role=_ROLE_BY_VALUE.get(role) or UserRole(role))
+        if isinstance(payload.get("exp"), (int, float)):
+            with _token_cache_lock:
+                _token_cache[token] = (payload["exp"], user)
+        return user
     
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
@@ -75,7 +180,11 @@ def require_authenticated(current_user: User = Depends(verify_token)) -> User:
 def authenticate_user(username: str, password: str) -> Optional[User]:
     """Authenticate user credentials"""
     user_data = MOCK_USERS.get(username)
-    if user_data and user_data["password"] == password:
+    if not user_data:
+        _bcrypt_matches(password, _DUMMY_HASH)
+        return None
+    
+    if _check_password(username, password, user_data["pwhash"]):
         return User(
             username=username,
             role=user_data["role"],
@@ -0,0 +1,22 @@
+import re
+
+# Issue-type keywords shared by analytics and AI confidence scoring. Each
+# classifier scans the type string once with a precompiled regex; when several
+# keywords match, the same precedence as the old if/elif cascades applies.
+_SERVICE_RE = re.compile(r"S3|IAM|Security Group")
+_SERVICE_BY_KEYWORD = {"S3": "S3", "IAM": "IAM", "Security Group": "EC2"}
+_SERVICE_PRIORITY = {"S3": 0, "IAM": 1, "EC2": 2}
+
+_SEVERITY_RE = re.compile(r"public|unrestricted|permissive|iam", re.IGNORECASE)
+_SEVERITY_BY_KEYWORD = {"public": "High", "unrestricted": "High", "permissive": "Medium", "iam": "Medium"}
+_SEVERITY_RANK = {"High": 2, "Medium": 1, "Low": 0}
+
+def classify_service(issue_type: str) -> str:
+    """Map an issue type to its AWS service ("S3", "IAM", "EC2" or "Other")"""
+    services = [_SERVICE_BY_KEYWORD[match] for match in _SERVICE_RE.findall(issue_type)]
+    return min(services, key=_SERVICE_PRIORITY.__getitem__) if services else "Other"
+
+def classify_severity(issue_type: str) -> str:
+    """Map an issue type to its severity ("High", "Medium" or "Low")"""
+    severities = [_SEVERITY_BY_KEYWORD[match.lower()] for match in _SEVERITY_RE.findall(issue_type)]
+    return max(severities, key=_SEVERITY_RANK.__getitem__) if severities else "Low"
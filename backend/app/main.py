@@ -1,18 +1,27 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List
-from .scanner import scan_all, scan_with_credentials
-from .ai_suggestions import get_bulk_suggestions
+from typing import Literal, Optional, List
+from .scanner import scan_all, scan_with_credentials, invalidate_scan_cache
+from .ai_suggestions import get_bulk_suggestions, get_bulk_suggestions_batch, iter_bulk_suggestions
 from .auth import (
     User, UserRole, LoginRequest, 
     authenticate_user, create_access_token,
     require_admin, require_authenticated
 )
 from .analytics import AnalyticsService
+import orjson
 import os
 
-app = FastAPI()
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson, which writes bytes directly and is much faster than json.dumps"""
+    
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+app = FastAPI(default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,6 +40,11 @@ class ScanRequest(BaseModel):
     credentials: Optional[AWSCredentials] = None
     ai_confidence_threshold: Optional[float] = 0.7  # 0.0 = show all, 1.0 = only high confidence
     strictness_level: Optional[str] = "balanced"  # "lenient", "balanced", "strict"
+    scan_type: Literal["ai_powered", "automated"] = "ai_powered"  # interactive or scheduled
+    refresh: Optional[bool] = False  # True = ignore recently cached results for these credentials
+
+# How long an automated scan waits on a Groq batch before falling back to direct requests
+BATCH_SUGGESTIONS_DEADLINE_SECONDS = 600
 
 @app.get("/")
 def read_root():
@@ -63,6 +77,14 @@ def get_current_user(current_user: User = Depends(require_authenticated)):
         "email": current_user.email
     }
 
+def _drop_cached_scan_on_refresh(request: ScanRequest):
+    if request.refresh:
+        invalidate_scan_cache(
+            request.credentials.access_key_id,
+            request.credentials.secret_access_key,
+            request.credentials.region
+        )
+
 @app.get("/scan")
 def run_scan():
     return scan_all()
@@ -74,6 +96,7 @@ def run_scan_with_credentials(
 ):
     """Run scan with custom credentials - requires authentication"""
     if request.credentials:
+        _drop_cached_scan_on_refresh(request)
         return scan_with_credentials(
             request.credentials.access_key_id,
             request.credentials.secret_access_key,
@@ -82,8 +105,26 @@ def run_scan_with_credentials(
     else:
         return scan_all()
 
+async def _scan_for_request(request: ScanRequest):
+    if request.credentials:
+        print("Using provided credentials")
+        _drop_cached_scan_on_refresh(request)
+        # boto3 calls block, so keep them off the event loop
+        misconfigs = await run_in_threadpool(
+            scan_with_credentials,
+            request.credentials.access_key_id,
+            request.credentials.secret_access_key,
+            request.credentials.region
+        )
+    else:
+        print("Using default credentials/mock data")
+        misconfigs = await run_in_threadpool(scan_all)
+    
+    print(f"Found {len(misconfigs)} misconfigurations")
+    return misconfigs
+
 @app.post("/scan-with-suggestions")
-def scan_with_ai_suggestions(
+async def scan_with_ai_suggestions(
     request: ScanRequest,
     current_user: User = Depends(require_authenticated)
 ):
@@ -91,25 +132,25 @@ def scan_with_ai_suggestions(
     try:
         print(f"User {current_user.username} ({current_user.role}) initiated scan")
         
-        if request.credentials:
-            print("Using provided credentials")
-            misconfigs = scan_with_credentials(
-                request.credentials.access_key_id,
-                request.credentials.secret_access_key,
-                request.credentials.region
-            )
-        else:
-            print("Using default credentials/mock data")
-            misconfigs = scan_all()
+        misconfigs = await _scan_for_request(request)
         
-        print(f"Found {len(misconfigs)} misconfigurations")
+        scan_type = request.scan_type
         
-        # Get AI suggestions for each misconfiguration with filtering
-        suggestions = get_bulk_suggestions(
-            misconfigs, 
-            ai_confidence_threshold=request.ai_confidence_threshold or 0.7,
-            strictness_level=request.strictness_level or "balanced"
-        )
+        # Get AI suggestions for each misconfiguration with filtering.
+        # Scheduled scans aren't latency sensitive, so they go through the cheaper Batch API.
+        if scan_type == "automated":
+            suggestions = await get_bulk_suggestions_batch(
+                misconfigs,
+                ai_confidence_threshold=request.ai_confidence_threshold or 0.7,
+                strictness_level=request.strictness_level or "balanced",
+                deadline_seconds=BATCH_SUGGESTIONS_DEADLINE_SECONDS
+            )
+        else:
+            suggestions = await get_bulk_suggestions(
+                misconfigs, 
+                ai_confidence_threshold=request.ai_confidence_threshold or 0.7,
+                strictness_level=request.strictness_level or "balanced"
+            )
         print(f"Generated suggestions for {len(suggestions)} items (filtered by confidence threshold)")
         
         # Add metadata to suggestions
@@ -121,7 +162,7 @@ def scan_with_ai_suggestions(
         AnalyticsService.record_scan(
             user=current_user.username,
             misconfigurations=suggestions,
-            scan_type="ai_powered"
+            scan_type=scan_type
         )
         
         return {
@@ -129,7 +170,7 @@ def scan_with_ai_suggestions(
             "scan_metadata": {
                 "total_findings": len(suggestions),
                 "scanned_by": current_user.username,
-                "scan_type": "ai_powered",
+                "scan_type": scan_type,
                 "timestamp": misconfigs[0].get("timestamp") if misconfigs else None
             }
         }
@@ -140,13 +181,52 @@ def scan_with_ai_suggestions(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/scan-with-suggestions/stream")
+async def stream_scan_with_ai_suggestions(
+    request: ScanRequest,
+    current_user: User = Depends(require_authenticated)
+):
+    """
+    AI-powered scan that streams findings as NDJSON, one line per finding as soon
+    as its suggestion is ready - requires authentication
+    """
+    print(f"User {current_user.username} ({current_user.role}) initiated streaming scan")
+    misconfigs = await _scan_for_request(request)
+    
+    async def _stream():
+        findings = []
+        async for suggestion in iter_bulk_suggestions(
+            misconfigs,
+            ai_confidence_threshold=request.ai_confidence_threshold or 0.7,
+            strictness_level=request.strictness_level or "balanced"
+        ):
+            suggestion["can_remediate"] = current_user.role == UserRole.ADMIN
+            suggestion["scanned_by"] = current_user.username
+            findings.append(suggestion)
+            yield orjson.dumps(suggestion) + b"\n"
+        
+        # Record scan for analytics once every finding has been sent
+        AnalyticsService.record_scan(
+            user=current_user.username,
+            misconfigurations=findings,
+            scan_type="ai_powered"
+        )
+    
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
 @app.get("/analytics/dashboard")
 def get_analytics_dashboard(
+    request: Request,
+    response: Response,
     days: int = 30,
     current_user: User = Depends(require_authenticated)
 ):
-    """Get analytics dashboard data"""
-    return AnalyticsService.get_dashboard_metrics(days)
+    """Get analytics dashboard data (304 Not Modified if the client's ETag is current)"""
+    etag, metrics = AnalyticsService.get_cached_dashboard_metrics(days, request.headers.get("if-none-match"))
+    if metrics is None:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return metrics
 
 @app.post("/analytics/remediation")
 def record_remediation_action(
@@ -1,145 +1,281 @@
 import boto3
+import hashlib
+import itertools
+import orjson
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from botocore.exceptions import ClientError, NoCredentialsError
+from cachetools import TTLCache
+
+# Thread pool size for per-bucket / per-role inspection (all calls are network-bound)
+MAX_SCAN_WORKERS = 16
+
+# Scan results are reused for this long per credentials/region (dashboards re-scan often)
+SCAN_CACHE_TTL_SECONDS = 300
+
+# Largest page size the list/describe APIs accept, to keep round-trips down
+PAGINATION_CONFIG = {'PageSize': 1000}
+
+# Error codes for a call the credentials are valid for but not permitted to make
+ACCESS_DENIED_ERROR_CODES = ('AccessDenied', 'AccessDeniedException')
+
+PUBLIC_ACCESS_BLOCK_FLAGS = (
+    'BlockPublicAcls', 'IgnorePublicAcls', 'BlockPublicPolicy', 'RestrictPublicBuckets'
+)
+
+# Mock findings returned when no (or invalid) credentials are available. They are
+# shared between calls, so callers must copy before mutating.
+_MOCK_S3 = ({
+    'type': 'Public S3 Bucket',
+    'resource_id': 'mock-bucket-123',
+    'details': 'This bucket is publicly accessible (mock data - provide credentials for real scan).'
+},)
+_MOCK_IAM = ({
+    'type': 'Overly Permissive IAM Role',
+    'resource_id': 'mock-role-abc',
+    'details': 'This role has overly permissive policies (mock data - provide credentials for real scan).'
+},)
+_MOCK_SG = ({
+    'type': 'Unrestricted Security Group',
+    'resource_id': 'sg-mock123',
+    'details': 'Security group allows unrestricted access (mock data - provide credentials for real scan).'
+},)
+_MOCK_ALL = _MOCK_S3 + _MOCK_IAM + _MOCK_SG
+
+_INVALID_CREDENTIALS_S3 = ({
+    'type': 'Public S3 Bucket',
+    'resource_id': 'mock-bucket-123',
+    'details': 'This bucket is publicly accessible (mock data - invalid credentials).'
+},)
+_INVALID_CREDENTIALS_IAM = ({
+    'type': 'Overly Permissive IAM Role',
+    'resource_id': 'mock-role-abc',
+    'details': 'This role has overly permissive policies (mock data - invalid credentials).'
+},)
+_INVALID_CREDENTIALS_SG = ({
+    'type': 'Unrestricted Security Group',
+    'resource_id': 'sg-mock123',
+    'details': 'Security group allows unrestricted access (mock data - invalid credentials).'
+},)
+
+# Building a client loads service models and endpoint rules, so sessions and
+# clients are kept per credentials/region and reused across scans (bounded LRU).
+# Sessions aren't thread-safe, so client creation is serialized; the clients
+# themselves are, so one client is shared by all worker threads.
+_client_lock = threading.Lock()
+
+@lru_cache(maxsize=16)
+def _session(aws_access_key_id, aws_secret_access_key, region):
+    return boto3.session.Session(
+        aws_access_key_id=aws_access_key_id,
+        aws_secret_access_key=aws_secret_access_key,
+        region_name=region
+    )
+
+@lru_cache(maxsize=48)
+def _cached_client(service, aws_access_key_id, aws_secret_access_key, region):
+    return _session(aws_access_key_id, aws_secret_access_key, region).client(service)
+
+def _client(service, aws_access_key_id, aws_secret_access_key, region):
+    """Low-level boto3 client for the service, reused across scans with the same credentials"""
+    with _client_lock:
+        return _cached_client(service, aws_access_key_id, aws_secret_access_key, region)
+
+_scan_cache = TTLCache(maxsize=32, ttl=SCAN_CACHE_TTL_SECONDS)
+_scan_cache_lock = threading.Lock()
+
+def _run_concurrently(*scans):
+    """Run scanner functions in parallel and concatenate their findings in order"""
+    with ThreadPoolExecutor(max_workers=len(scans)) as executor:
+        futures = [executor.submit(scan) for scan in scans]
+        return list(itertools.chain.from_iterable(future.result() for future in futures))
+
+def _statements(document):
+    """Policy documents allow a single statement object or a list of them"""
+    statements = document.get('Statement', [])
+    return statements if isinstance(statements, list) else [statements]
+
+def _allows_public_principal(statement):
+    if statement.get('Effect') != 'Allow':
+        return False
+    principal = statement.get('Principal')
+    if isinstance(principal, dict):
+        principal = principal.get('AWS')
+    return principal == '*' or (isinstance(principal, list) and '*' in principal)
+
+def _allows_all_actions(statement):
+    return (statement.get('Effect') == 'Allow' and 
+            statement.get('Action') == '*' and 
+            statement.get('Resource') == '*')
+
+def _bucket_policy_is_public(s3, bucket_name):
+    try:
+        return s3.get_bucket_policy_status(Bucket=bucket_name)['PolicyStatus']['IsPublic']
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'NoSuchBucketPolicy':
+            return False
+    # Policy status isn't available (e.g. missing s3:GetBucketPolicyStatus), so
+    # inspect the policy document ourselves
+    try:
+        document = orjson.loads(s3.get_bucket_policy(Bucket=bucket_name)['Policy'])
+    except ClientError:
+        return False  # No bucket policy exists
+    return any(_allows_public_principal(statement) for statement in _statements(document))
+
+def _public_access_block(s3, bucket_name):
+    try:
+        return s3.get_public_access_block(Bucket=bucket_name)['PublicAccessBlockConfiguration']
+    except ClientError:
+        return {}  # No public access block configured
+
+def _inspect_bucket(s3, bucket_name):
+    misconfigurations = []
+    try:
+        block = _public_access_block(s3, bucket_name)
+        if all(block.get(flag) for flag in PUBLIC_ACCESS_BLOCK_FLAGS):
+            return misconfigurations  # AWS blocks every form of public access
+        
+        # Check bucket ACL (ignored by AWS when IgnorePublicAcls is set)
+        if not block.get('IgnorePublicAcls'):
+            acl = s3.get_bucket_acl(Bucket=bucket_name)
+            for grant in acl['Grants']:
+                if 'URI' in grant['Grantee'] and 'AllUsers' in grant['Grantee']['URI']:
+                    misconfigurations.append({
+                        'type': 'Public S3 Bucket',
+                        'resource_id': bucket_name,
+                        'details': 'This bucket is publicly accessible via ACL.'
+                    })
+                    break
+        
+        # Check bucket policy for public access
+        if not block.get('RestrictPublicBuckets') and _bucket_policy_is_public(s3, bucket_name):
+            misconfigurations.append({
+                'type': 'Public S3 Bucket Policy',
+                'resource_id': bucket_name,
+                'details': 'This bucket has a policy allowing public access.'
+            })
+            
+    except Exception:
+        pass
+    return misconfigurations
 
 def find_public_s3_buckets(aws_access_key_id=None, aws_secret_access_key=None, region='us-east-1'):
     # If no credentials provided, return mock data immediately
     if not aws_access_key_id or not aws_secret_access_key:
-        return [
-            {
-                'type': 'Public S3 Bucket',
-                'resource_id': 'mock-bucket-123',
-                'details': 'This bucket is publicly accessible (mock data - provide credentials for real scan).'
-            }
-        ]
+        return list(_MOCK_S3)
     
     try:
-        s3 = boto3.client(
-            's3',
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            region_name=region
-        )
+        s3 = _client('s3', aws_access_key_id, aws_secret_access_key, region)
         
-        misconfigurations = []
-        for bucket in s3.list_buckets().get('Buckets', []):
-            try:
-                # Check bucket ACL
-                acl = s3.get_bucket_acl(Bucket=bucket['Name'])
-                for grant in acl['Grants']:
-                    if 'URI' in grant['Grantee'] and 'AllUsers' in grant['Grantee']['URI']:
-                        misconfigurations.append({
-                            'type': 'Public S3 Bucket',
-                            'resource_id': bucket['Name'],
-                            'details': 'This bucket is publicly accessible via ACL.'
-                        })
-                        break
-                
-                # Check bucket policy for public access
-                try:
-                    policy = s3.get_bucket_policy(Bucket=bucket['Name'])
-                    if '"Principal": "*"' in policy['Policy'] or '"Principal": {"AWS": "*"}' in policy['Policy']:
-                        misconfigurations.append({
-                            'type': 'Public S3 Bucket Policy',
-                            'resource_id': bucket['Name'],
-                            'details': 'This bucket has a policy allowing public access.'
-                        })
-                except ClientError:
-                    pass  # No bucket policy exists
-                    
-            except Exception as e:
-                continue
+        # Buckets are inspected while later pages are still being listed
+        with ThreadPoolExecutor(max_workers=MAX_SCAN_WORKERS) as executor:
+            futures = [
+                executor.submit(_inspect_bucket, s3, bucket['Name'])
+                for page in s3.get_paginator('list_buckets').paginate(PaginationConfig=PAGINATION_CONFIG)
+                for bucket in page.get('Buckets', [])
+            ]
+            misconfigurations = list(itertools.chain.from_iterable(future.result() for future in futures))
                 
         return misconfigurations
     except (NoCredentialsError, ClientError):
         # Return mock data if credentials are invalid
-        return [
-            {
-                'type': 'Public S3 Bucket',
-                'resource_id': 'mock-bucket-123',
-                'details': 'This bucket is publicly accessible (mock data - invalid credentials).'
-            }
-        ]
+        return list(_INVALID_CREDENTIALS_S3)
+
+def _attached_policies(iam, role_name):
+    return [
+        policy
+        for page in iam.get_paginator('list_attached_role_policies').paginate(
+            RoleName=role_name, PaginationConfig=PAGINATION_CONFIG
+        )
+        for policy in page.get('AttachedPolicies', [])
+    ]
+
+def _policy_allows_all_actions(iam, policy_arn, version_id=None):
+    try:
+        if version_id is None:
+            version_id = iam.get_policy(PolicyArn=policy_arn)['Policy']['DefaultVersionId']
+        policy_version = iam.get_policy_version(PolicyArn=policy_arn, VersionId=version_id)
+        return any(
+            _allows_all_actions(statement)
+            for statement in _statements(policy_version['PolicyVersion']['Document'])
+        )
+    except Exception:
+        return False
+
+def _default_policy_versions(iam):
+    """
+    Default version of every attached policy in one listing, so each policy
+    document is fetched once no matter how many roles share it
+    """
+    try:
+        return {
+            policy['Arn']: policy['DefaultVersionId']
+            for page in iam.get_paginator('list_policies').paginate(
+                OnlyAttached=True, PaginationConfig=PAGINATION_CONFIG
+            )
+            for policy in page.get('Policies', [])
+        }
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ACCESS_DENIED_ERROR_CODES:
+            raise
+        # Without iam:ListPolicies each policy's default version is looked up per policy
+        return {}
 
 def find_permissive_iam_roles(aws_access_key_id=None, aws_secret_access_key=None, region='us-east-1'):
     # If no credentials provided, return mock data immediately
     if not aws_access_key_id or not aws_secret_access_key:
-        return [
-            {
-                'type': 'Overly Permissive IAM Role',
-                'resource_id': 'mock-role-abc',
-                'details': 'This role has overly permissive policies (mock data - provide credentials for real scan).'
-            }
-        ]
+        return list(_MOCK_IAM)
     
     try:
-        iam = boto3.client(
-            'iam',
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            region_name=region
-        )
+        iam = _client('iam', aws_access_key_id, aws_secret_access_key, region)
         
-        misconfigurations = []
-        roles = iam.list_roles().get('Roles', [])
+        default_versions = _default_policy_versions(iam)
         
-        for role in roles:
-            # Check attached policies
-            policies = iam.list_attached_role_policies(RoleName=role['RoleName']).get('AttachedPolicies', [])
-            for policy in policies:
-                try:
-                    policy_version = iam.get_policy_version(
-                        PolicyArn=policy['PolicyArn'],
-                        VersionId=iam.get_policy(PolicyArn=policy['PolicyArn'])['Policy']['DefaultVersionId']
-                    )
-                    statements = policy_version['PolicyVersion']['Document']['Statement']
-                    if not isinstance(statements, list):
-                        statements = [statements]
-                    
-                    for statement in statements:
-                        if (statement.get('Effect') == 'Allow' and 
-                            statement.get('Action') == '*' and 
-                            statement.get('Resource') == '*'):
-                            misconfigurations.append({
-                                'type': 'Overly Permissive IAM Role',
-                                'resource_id': role['RoleName'],
-                                'details': f'Role has policy {policy["PolicyName"]} allowing all actions on all resources.'
-                            })
-                            break
-                except Exception:
-                    continue
+        misconfigurations = []
+        with ThreadPoolExecutor(max_workers=MAX_SCAN_WORKERS) as executor:
+            policy_checks = {
+                arn: executor.submit(_policy_allows_all_actions, iam, arn, version_id)
+                for arn, version_id in default_versions.items()
+            }
+            role_policies = [
+                (role, executor.submit(_attached_policies, iam, role['RoleName']))
+                for page in iam.get_paginator('list_roles').paginate(PaginationConfig=PAGINATION_CONFIG)
+                for role in page.get('Roles', [])
+            ]
+            
+            for role, policies in role_policies:
+                for policy in policies.result():
+                    check = policy_checks.get(policy['PolicyArn'])
+                    if check is None:
+                        # Attached after the policy listing above
+                        check = policy_checks[policy['PolicyArn']] = executor.submit(
+                            _policy_allows_all_actions, iam, policy['PolicyArn']
+                        )
+                    if check.result():
+                        misconfigurations.append({
+                            'type': 'Overly Permissive IAM Role',
+                            'resource_id': role['RoleName'],
+                            'details': f'Role has policy {policy["PolicyName"]} allowing all actions on all resources.'
+                        })
                     
         return misconfigurations
     except (NoCredentialsError, ClientError):
-        return [
-            {
-                'type': 'Overly Permissive IAM Role',
-                'resource_id': 'mock-role-abc',
-                'details': 'This role has overly permissive policies (mock data - invalid credentials).'
-            }
-        ]
+        return list(_INVALID_CREDENTIALS_IAM)
 
 def find_unrestricted_security_groups(aws_access_key_id=None, aws_secret_access_key=None, region='us-east-1'):
     # If no credentials provided, return mock data immediately
     if not aws_access_key_id or not aws_secret_access_key:
-        return [{
-            'type': 'Unrestricted Security Group',
-            'resource_id': 'sg-mock123',
-            'details': 'Security group allows unrestricted access (mock data - provide credentials for real scan).'
-        }]
+        return list(_MOCK_SG)
     
     try:
-        ec2 = boto3.client(
-            'ec2',
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            region_name=region
-        )
+        ec2 = _client('ec2', aws_access_key_id, aws_secret_access_key, region)
         
         misconfigurations = []
-        security_groups = ec2.describe_security_groups()['SecurityGroups']
+        pages = ec2.get_paginator('describe_security_groups').paginate(PaginationConfig=PAGINATION_CONFIG)
         
-        for sg in security_groups:
+        for sg in itertools.chain.from_iterable(page['SecurityGroups'] for page in pages):
             for rule in sg['IpPermissions']:
                 for ip_range in rule.get('IpRanges', []):
                     if ip_range.get('CidrIp') == '0.0.0.0/0':
@@ -153,22 +289,37 @@ def find_unrestricted_security_groups(aws_access_key_id=None, aws_secret_access_
                         
         return misconfigurations
     except (NoCredentialsError, ClientError):
-        return [{
-            'type': 'Unrestricted Security Group',
-            'resource_id': 'sg-mock123',
-            'details': 'Security group allows unrestricted access (mock data - invalid credentials).'
-        }]
+        return list(_INVALID_CREDENTIALS_SG)
 
 def scan_all():
     """Scan with default/environment credentials"""
-    s3_issues = find_public_s3_buckets()
-    iam_issues = find_permissive_iam_roles()
-    sg_issues = find_unrestricted_security_groups()
-    return s3_issues + iam_issues + sg_issues
+    # The find_* functions only use the credentials they are given, so this is mock data
+    return list(_MOCK_ALL)
+
+def _scan_cache_key(aws_access_key_id, aws_secret_access_key, region):
+    # Hash the key pair so raw secrets are never kept as cache keys
+    digest = hashlib.blake2b(f"{aws_access_key_id}\0{aws_secret_access_key}".encode(), digest_size=16)
+    return digest.hexdigest(), region
+
+def invalidate_scan_cache(aws_access_key_id, aws_secret_access_key, region='us-east-1'):
+    """Forget the cached scan for these credentials so the next scan goes to AWS"""
+    with _scan_cache_lock:
+        _scan_cache.pop(_scan_cache_key(aws_access_key_id, aws_secret_access_key, region), None)
 
 def scan_with_credentials(aws_access_key_id, aws_secret_access_key, region='us-east-1'):
-    """Scan with provided AWS credentials"""
-    s3_issues = find_public_s3_buckets(aws_access_key_id, aws_secret_access_key, region)
-    iam_issues = find_permissive_iam_roles(aws_access_key_id, aws_secret_access_key, region)
-    sg_issues = find_unrestricted_security_groups(aws_access_key_id, aws_secret_access_key, region)
-    return s3_issues + iam_issues + sg_issues 
\ No newline at end of file
+    """Scan with provided AWS credentials (results are reused for SCAN_CACHE_TTL_SECONDS)"""
+    key = _scan_cache_key(aws_access_key_id, aws_secret_access_key, region)
+    with _scan_cache_lock:
+        findings = _scan_cache.get(key)
+    
+    if findings is None:
+        findings = tuple(_run_concurrently(
+            partial(find_public_s3_buckets, aws_access_key_id, aws_secret_access_key, region),
+            partial(find_permissive_iam_roles, aws_access_key_id, aws_secret_access_key, region),
+            partial(find_unrestricted_security_groups, aws_access_key_id, aws_secret_access_key, region)
+        ))
+        with _scan_cache_lock:
+            _scan_cache[key] = findings
+    
+    # Callers get their own copies of the cached findings
+    return [dict(finding) for finding in findings]
\ No newline at end of file
@@ -0,0 +1,32 @@
+import os
+import pytest
+import time
+from fastapi.security import HTTPAuthorizationCredentials
+
+# The Groq client refuses to build without a key; tests never reach the real API
+os.environ.setdefault("GROQ_API_KEY", "test-dummy")
+
+from app.auth import UserRole, create_access_token, _encode_token
+
+# Tokens are signed once per test session and shared by every test that needs one
+
+@pytest.fixture(scope="session")
+def admin_token():
+    """Valid access token for an admin user"""
+    return create_access_token("testuser", UserRole.ADMIN)
+
+@pytest.fixture(scope="session")
+def admin_credentials(admin_token):
+    """Bearer credentials carrying the admin token"""
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=admin_token)
+
+@pytest.fixture(scope="session")
+def expired_credentials():
+    """Bearer credentials carrying an admin token that expired an hour ago"""
+    payload = {
+        "sub": "testuser",
+        "role": UserRole.ADMIN.value,
+        "exp": int(time.time()) - 3600
+    }
+    expired_token = _encode_token(payload)
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=expired_token)
@@ -1,141 +1,188 @@
+import asyncio
+import json
 import pytest
-from unittest.mock import patch, MagicMock
+import respx
+from groq import AsyncGroq
+from types import MappingProxyType
+from unittest.mock import patch, MagicMock, AsyncMock
 from app.ai_suggestions import (
     get_remediation_suggestions,
     get_bulk_suggestions,
-    calculate_confidence_score
+    get_bulk_suggestions_batch,
+    FUSED_SUGGESTIONS_PER_REQUEST,
+    iter_bulk_suggestions,
+    calculate_confidence_score,
+    _build_prompt,
+    _cache_put,
+    _score,
+    _suggestion_cache
 )
 
+# Shared read-only findings; MappingProxyType makes any accidental mutation fail loudly
+PUBLIC_S3 = MappingProxyType({"type": "Public S3 Bucket", "resource_id": "bucket-123"})
+PUBLIC_S3_WITH_DETAILS = MappingProxyType({**PUBLIC_S3, "details": "Publicly accessible bucket"})
+IAM_ROLE = MappingProxyType({"type": "Overly Permissive IAM Role", "resource_id": "role-123"})
+OTHER_ISSUE = MappingProxyType({"type": "Some Other Issue", "resource_id": "resource-123"})
+
+# Raw Groq chat completion body, served at the HTTP layer by respx
+GROQ_CHAT_COMPLETIONS_URL = "https://api.groq.com/openai/v1/chat/completions"
+CANNED_JSON = {
+    "id": "chatcmpl-test",
+    "object": "chat.completion",
+    "created": 1700000000,
+    "model": "llama-3.1-8b-instant",
+    "choices": [{
+        "index": 0,
+        "message": {"role": "assistant", "content": "## Security Risk\nThis is a test suggestion"},
+        "finish_reason": "stop"
+    }]
+}
+
+def _canned_response(content="## Security Risk\nThis is a test suggestion"):
+    """Chat completion response carrying the given suggestion text"""
+    response = MagicMock()
+    response.choices[0].message.content = content
+    return response
+
+@pytest.fixture(scope="module", autouse=True)
+def mock_groq():
+    """Replace the Groq client once for the whole module"""
+    mock = MagicMock()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr("app.ai_suggestions.aclient", mock)
+        yield mock
+
+@pytest.fixture(scope="module")
+def canned_groq_response():
+    """Chat completion response shared by every test that doesn't need its own text"""
+    return _canned_response()
+
+@pytest.fixture(scope="module")
+def canned_suggestion():
+    """Suggestion returned by a stubbed suggestion fetch"""
+    return {"suggestion": "Test suggestion", "confidence": "high"}
+
+@pytest.fixture(autouse=True)
+def reset_mock_groq(mock_groq, canned_groq_response):
+    """Give each test the canned completion and clear recorded calls"""
+    mock_groq.reset_mock(return_value=True, side_effect=True)
+    mock_groq.chat.completions.create = AsyncMock(return_value=canned_groq_response)
+
+@pytest.fixture(autouse=True)
+def clear_suggestion_cache():
+    """Keep cached suggestions from leaking between tests"""
+    _suggestion_cache.clear()
+    yield
+    _suggestion_cache.clear()
+
 class TestAISuggestions:
     """Test cases for AI suggestions functionality"""
     
-    def test_calculate_confidence_score_high_risk(self):
-        """Test confidence score calculation for high risk issues"""
-        misconfiguration = {
-            "type": "Public S3 Bucket",
-            "resource_id": "bucket-123"
-        }
-        
+    @pytest.mark.parametrize("misconfiguration, lo, hi", [
+        (PUBLIC_S3, 0.8, 1.01),    # High confidence for public resources
+        (IAM_ROLE, 0.6, 0.8),      # Medium confidence
+        (OTHER_ISSUE, 0.5, 0.7),   # Lower confidence
+    ], ids=["high_risk", "medium_risk", "low_risk"])
+    def test_calculate_confidence_score_band(self, misconfiguration, lo, hi):
+        """Test confidence score calculation lands in the band for the issue's risk"""
         score = calculate_confidence_score(misconfiguration, "balanced")
-        assert score >= 0.8  # Should be high confidence for public resources
-    
-    def test_calculate_confidence_score_medium_risk(self):
-        """Test confidence score calculation for medium risk issues"""
-        misconfiguration = {
-            "type": "Overly Permissive IAM Role",
-            "resource_id": "role-123"
-        }
-        
-        score = calculate_confidence_score(misconfiguration, "balanced")
-        assert 0.6 <= score < 0.8  # Should be medium confidence
-    
-    def test_calculate_confidence_score_low_risk(self):
-        """Test confidence score calculation for low risk issues"""
-        misconfiguration = {
-            "type": "Some Other Issue",
-            "resource_id": "resource-123"
-        }
-        
-        score = calculate_confidence_score(misconfiguration, "balanced")
-        assert 0.5 <= score < 0.7  # Should be lower confidence
+        assert lo <= score < hi
     
     def test_calculate_confidence_score_strict_mode(self):
         """Test confidence score in strict mode"""
-        misconfiguration = {
-            "type": "Public S3 Bucket",
-            "resource_id": "bucket-123"
-        }
-        
-        balanced_score = calculate_confidence_score(misconfiguration, "balanced")
-        strict_score = calculate_confidence_score(misconfiguration, "strict")
+        balanced_score = calculate_confidence_score(PUBLIC_S3, "balanced")
+        strict_score = calculate_confidence_score(PUBLIC_S3, "strict")
         
         assert strict_score > balanced_score
     
     def test_calculate_confidence_score_lenient_mode(self):
         """Test confidence score in lenient mode"""
-        misconfiguration = {
-            "type": "Public S3 Bucket", 
-            "resource_id": "bucket-123"
-        }
-        
-        balanced_score = calculate_confidence_score(misconfiguration, "balanced")
-        lenient_score = calculate_confidence_score(misconfiguration, "lenient")
+        balanced_score = calculate_confidence_score(PUBLIC_S3, "balanced")
+        lenient_score = calculate_confidence_score(PUBLIC_S3, "lenient")
         
         assert lenient_score < balanced_score
     
+    def test_confidence_score_is_memoized_by_type(self):
+        """Test repeat scores for the same issue type come from the cache"""
+        _score.cache_clear()
+        
+        first = calculate_confidence_score(PUBLIC_S3)
+        second = calculate_confidence_score(dict(PUBLIC_S3, resource_id="bucket-456"))
+        
+        assert first == second
+        assert _score.cache_info().hits == 1
+        assert _score.cache_info().misses == 1
+    
+    def test_cache_admits_configured_fraction(self):
+        """Test only the configured share of new suggestions is stored in the cache"""
+        with patch('app.ai_suggestions.SUGGESTION_CACHE_ADMISSION_RATE', 0.25), \
+                patch('app.ai_suggestions._admission_accumulator', [0.0]):
+            for i in range(8):
+                _cache_put(f"key-{i}", {"suggestion": "Fix", "confidence": "high"})
+        
+        assert sorted(_suggestion_cache) == ["key-3", "key-7"]
+    
+    def test_build_prompt_fills_fields(self):
+        """Test the prompt template is filled in, with missing fields left empty"""
+        prompt = _build_prompt(PUBLIC_S3)
+        
+        assert "Issue: Public S3 Bucket" in prompt
+        assert "Resource: <RESOURCE_ID>" in prompt
+        assert "bucket-123" not in prompt
+        assert "Problem: \n" in prompt
+    
     def test_confidence_score_bounds(self):
         """Test confidence score is always between 0 and 1"""
-        misconfiguration = {
-            "type": "Public S3 Bucket",
-            "resource_id": "bucket-123"
-        }
-        
         for strictness in ["lenient", "balanced", "strict"]:
-            score = calculate_confidence_score(misconfiguration, strictness)
+            score = calculate_confidence_score(PUBLIC_S3, strictness)
             assert 0.0 <= score <= 1.0
     
-    @patch('app.ai_suggestions.client')
-    def test_get_remediation_suggestions_success(self, mock_client):
+    @pytest.mark.asyncio
+    @respx.mock
+    async def test_get_remediation_suggestions_success(self, monkeypatch):
         """Test successful AI suggestion generation"""
-        # Mock the Groq API response
-        mock_response = MagicMock()
-        mock_response.choices[0].message.content = "## Security Risk\nThis is a test suggestion"
-        mock_client.chat.completions.create.return_value = mock_response
-        
-        misconfiguration = {
-            "type": "Public S3 Bucket",
-            "resource_id": "bucket-123",
-            "details": "Publicly accessible bucket"
-        }
+        # Real client, canned HTTP response: exercises the SDK's request and parsing
+        monkeypatch.setattr("app.ai_suggestions.aclient", AsyncGroq(api_key="test-key"))
+        route = respx.post(GROQ_CHAT_COMPLETIONS_URL).respond(json=CANNED_JSON)
+        
+        result = await get_remediation_suggestions(PUBLIC_S3_WITH_DETAILS)
         
-        result = get_remediation_suggestions(misconfiguration)
+        assert route.call_count == 1
+        assert json.loads(route.calls.last.request.content)["model"] == "llama-3.1-8b-instant"
         
         assert "suggestion" in result
         assert "confidence" in result
         assert result["suggestion"] == "## Security Risk\nThis is a test suggestion"
         assert result["confidence"] == "high"  # Public bucket = high confidence
     
+    @pytest.mark.asyncio
     @patch('app.ai_suggestions.api_key', None)
-    def test_get_remediation_suggestions_no_api_key(self):
+    async def test_get_remediation_suggestions_no_api_key(self):
         """Test AI suggestion when API key is missing"""
-        misconfiguration = {
-            "type": "Public S3 Bucket",
-            "resource_id": "bucket-123",
-            "details": "Publicly accessible bucket"
-        }
-        
-        result = get_remediation_suggestions(misconfiguration)
+        result = await get_remediation_suggestions(PUBLIC_S3_WITH_DETAILS)
         
         assert "suggestion" in result
         assert "confidence" in result
         assert "GROQ_API_KEY not configured" in result["suggestion"]
         assert result["confidence"] == "low"
     
-    @patch('app.ai_suggestions.client')
-    def test_get_remediation_suggestions_api_error(self, mock_client):
+    @pytest.mark.asyncio
+    async def test_get_remediation_suggestions_api_error(self, mock_groq):
         """Test AI suggestion when API call fails"""
-        mock_client.chat.completions.create.side_effect = Exception("API Error")
-        
-        misconfiguration = {
-            "type": "Public S3 Bucket",
-            "resource_id": "bucket-123",
-            "details": "Publicly accessible bucket"
-        }
+        mock_groq.chat.completions.create.side_effect = Exception("API Error")
         
-        result = get_remediation_suggestions(misconfiguration)
+        result = await get_remediation_suggestions(PUBLIC_S3_WITH_DETAILS)
         
         assert "suggestion" in result
         assert "confidence" in result
         assert "Unable to generate AI suggestion" in result["suggestion"]
         assert result["confidence"] == "low"
     
-    @patch('app.ai_suggestions.get_remediation_suggestions')
-    def test_get_bulk_suggestions_filtering(self, mock_get_suggestions):
+    @pytest.mark.asyncio
+    @patch('app.ai_suggestions.get_remediation_suggestions_batch')
+    async def test_get_bulk_suggestions_filtering(self, mock_get_batch, canned_suggestion):
         """Test bulk suggestions with confidence filtering"""
-        mock_get_suggestions.return_value = {
-            "suggestion": "Test suggestion",
-            "confidence": "high"
-        }
+        mock_get_batch.side_effect = lambda configs: [canned_suggestion] * len(configs)
         
         misconfigurations = [
             {"type": "Public S3 Bucket", "resource_id": "bucket-1"},  # High confidence
@@ -143,26 +190,25 @@ class TestAISuggestions:
         ]
         
         # Test with high threshold (should filter out low confidence)
-        results = get_bulk_suggestions(misconfigurations, ai_confidence_threshold=0.8)
+        results = await get_bulk_suggestions(misconfigurations, ai_confidence_threshold=0.8)
         assert len(results) == 1  # Only high confidence item
+        mock_get_batch.assert_awaited_once_with([misconfigurations[0]])
         
         # Test with low threshold (should include all)
-        results = get_bulk_suggestions(misconfigurations, ai_confidence_threshold=0.3)
+        results = await get_bulk_suggestions(misconfigurations, ai_confidence_threshold=0.3)
         assert len(results) == 2  # Both items
     
-    @patch('app.ai_suggestions.get_remediation_suggestions')
-    def test_get_bulk_suggestions_structure(self, mock_get_suggestions):
+    @pytest.mark.asyncio
+    @patch('app.ai_suggestions.get_remediation_suggestions_batch')
+    async def test_get_bulk_suggestions_structure(self, mock_get_batch, canned_suggestion):
         """Test bulk suggestions return proper structure"""
-        mock_get_suggestions.return_value = {
-            "suggestion": "Test suggestion",
-            "confidence": "high"
-        }
+        mock_get_batch.side_effect = lambda configs: [canned_suggestion] * len(configs)
         
         misconfigurations = [
             {"type": "Public S3 Bucket", "resource_id": "bucket-1", "details": "Test"}
         ]
         
-        results = get_bulk_suggestions(misconfigurations)
+        results = await get_bulk_suggestions(misconfigurations)
         
         assert len(results) == 1
         result = results[0]
@@ -176,4 +222,192 @@ class TestAISuggestions:
         assert "ai_suggestion" in result
         assert "confidence" in result
         assert "confidence_score" in result
-        assert "strictness_level" in result
\ No newline at end of file
+        assert "strictness_level" in result
+    
+    @pytest.mark.asyncio
+    async def test_get_bulk_suggestions_fuses_requests_and_preserves_order(self, mock_groq):
+        """Test findings share one JSON-mode Groq call and answers map back by index"""
+        # Answer out of order to prove results are matched by index, not position
+        mock_groq.chat.completions.create.return_value = _canned_response(json.dumps({
+            "suggestions": [
+                {"index": 1, "suggestion": "Fix bucket policy"},
+                {"index": 0, "suggestion": "Fix bucket ACL"}
+            ]
+        }))
+
+        misconfigurations = [
+            {"type": "Public S3 Bucket", "resource_id": "bucket-1", "details": "Public via ACL"},
+            {"type": "Public S3 Bucket", "resource_id": "bucket-2", "details": "Public via policy"}
+        ]
+
+        results = await get_bulk_suggestions(misconfigurations)
+
+        assert [r["resource_id"] for r in results] == ["bucket-1", "bucket-2"]
+        assert [r["ai_suggestion"] for r in results] == ["Fix bucket ACL", "Fix bucket policy"]
+        mock_groq.chat.completions.create.assert_awaited_once()
+        request = mock_groq.chat.completions.create.call_args.kwargs
+        assert request["response_format"] == {"type": "json_object"}
+        assert "Misconfiguration 1:" in request["messages"][0]["content"]
+
+    @pytest.mark.asyncio
+    async def test_get_bulk_suggestions_chunks_and_retries_unanswered(self, mock_groq):
+        """Test fused requests are capped in size and unanswered findings are retried one by one"""
+        fused_response = _canned_response(json.dumps({"suggestions": [{"index": 0, "suggestion": "Fused fix"}]}))
+        single_response = _canned_response("Single fix")
+        mock_groq.chat.completions.create.side_effect = (
+            lambda **kwargs: fused_response if "response_format" in kwargs else single_response
+        )
+
+        misconfigurations = [
+            {"type": "Public S3 Bucket", "resource_id": f"bucket-{i}", "details": f"Issue number {i}"}
+            for i in range(FUSED_SUGGESTIONS_PER_REQUEST + 1)
+        ]
+
+        results = await get_bulk_suggestions(misconfigurations)
+
+        # Two fused calls answer the first item of each chunk; the rest go one at a time
+        fused_calls = [c for c in mock_groq.chat.completions.create.call_args_list if "response_format" in c.kwargs]
+        assert len(fused_calls) == 2
+        assert mock_groq.chat.completions.create.await_count == 2 + FUSED_SUGGESTIONS_PER_REQUEST - 1
+        assert results[0]["ai_suggestion"] == "Fused fix"
+        assert results[FUSED_SUGGESTIONS_PER_REQUEST]["ai_suggestion"] == "Fused fix"
+        assert results[1]["ai_suggestion"] == "Single fix"
+
+    @pytest.mark.asyncio
+    async def test_get_bulk_suggestions_reuses_cached_suggestions(self, mock_groq):
+        """Test findings that only differ by resource name share one Groq call, each named in its own copy"""
+        mock_groq.chat.completions.create.return_value = _canned_response(json.dumps({
+            "suggestions": [{"index": 0, "suggestion": "Run put-public-access-block --bucket <RESOURCE_ID>"}]
+        }))
+
+        misconfigurations = [
+            {"type": "Public S3 Bucket", "resource_id": "bucket-1", "details": "Bucket logs-bucket-1 is public"},
+            {"type": "Public S3 Bucket", "resource_id": "bucket-2", "details": "Bucket logs-bucket-2 is public"}
+        ]
+
+        results = await get_bulk_suggestions(misconfigurations)
+        assert [r["ai_suggestion"] for r in results] == [
+            "Run put-public-access-block --bucket bucket-1",
+            "Run put-public-access-block --bucket bucket-2"
+        ]
+        assert mock_groq.chat.completions.create.await_count == 1
+        prompt = mock_groq.chat.completions.create.call_args.kwargs["messages"][0]["content"]
+        assert "bucket-1" not in prompt
+
+        # A later scan is served entirely from the cache
+        await get_bulk_suggestions(misconfigurations)
+        assert mock_groq.chat.completions.create.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_iter_bulk_suggestions_yields_in_completion_order(self):
+        """Test streamed suggestions are yielded as soon as each one finishes"""
+        async def fake_suggestion(config):
+            await asyncio.sleep(0.01 if config["resource_id"] == "bucket-1" else 0)
+            return {"suggestion": f"Fix {config['resource_id']}", "confidence": "high"}
+
+        misconfigurations = [
+            {"type": "Public S3 Bucket", "resource_id": "bucket-1", "details": "Public via ACL"},
+            {"type": "Public S3 Bucket", "resource_id": "bucket-2", "details": "Public via policy"},
+            {"type": "Some Other Issue", "resource_id": "resource-1", "details": "Filtered out"}
+        ]
+
+        with patch('app.ai_suggestions._fetch_suggestion', side_effect=fake_suggestion):
+            results = [item async for item in iter_bulk_suggestions(misconfigurations)]
+
+        assert [r["resource_id"] for r in results] == ["bucket-2", "bucket-1"]
+        assert results[0]["ai_suggestion"] == "Fix bucket-2"
+        assert results[0]["confidence_score"] == 0.9
+
+    @pytest.mark.asyncio
+    async def test_get_bulk_suggestions_batch_success(self, mock_groq):
+        """Test automated scans read suggestions from the Groq batch output"""
+        mock_groq.files.create = AsyncMock(return_value=MagicMock(id="file-in"))
+        mock_groq.batches.create = AsyncMock(
+            return_value=MagicMock(id="batch-1", status="completed", output_file_id="file-out")
+        )
+        output = MagicMock()
+        output.text = AsyncMock(return_value=json.dumps({
+            "custom_id": "0:bucket-1",
+            "response": {
+                "status_code": 200,
+                "body": {"choices": [{"message": {"content": "Batch suggestion"}}]}
+            },
+            "error": None
+        }))
+        mock_groq.files.content = AsyncMock(return_value=output)
+
+        misconfigurations = [
+            {"type": "Public S3 Bucket", "resource_id": "bucket-1", "details": "Test"}
+        ]
+
+        results = await get_bulk_suggestions_batch(misconfigurations)
+
+        assert len(results) == 1
+        assert results[0]["ai_suggestion"] == "Batch suggestion"
+        assert mock_groq.files.create.call_args.kwargs["purpose"] == "batch"
+        mock_groq.chat.completions.create.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch('app.ai_suggestions._fetch_suggestion')
+    async def test_get_bulk_suggestions_batch_falls_back(self, mock_get_suggestions, mock_groq):
+        """Test automated scans fall back to direct requests when the batch misses its deadline"""
+        mock_get_suggestions.return_value = {
+            "suggestion": "Direct suggestion",
+            "confidence": "high"
+        }
+        mock_groq.files.create = AsyncMock(return_value=MagicMock(id="file-in"))
+        mock_groq.batches.create = AsyncMock(
+            return_value=MagicMock(id="batch-1", status="in_progress")
+        )
+        mock_groq.batches.cancel = AsyncMock()
+
+        misconfigurations = [
+            {"type": "Public S3 Bucket", "resource_id": "bucket-1", "details": "Test"}
+        ]
+
+        results = await get_bulk_suggestions_batch(misconfigurations, deadline_seconds=0)
+
+        assert len(results) == 1
+        assert results[0]["ai_suggestion"] == "Direct suggestion"
+        mock_groq.batches.cancel.assert_awaited_once_with("batch-1")
+    
+    @pytest.mark.asyncio
+    @patch('app.ai_suggestions._fetch_suggestion')
+    async def test_get_bulk_suggestions_batch_skips_malformed_records(self, mock_get_suggestions, mock_groq):
+        """Test malformed batch output records fall back to direct requests instead of failing the scan"""
+        mock_get_suggestions.return_value = {
+            "suggestion": "Direct suggestion",
+            "confidence": "high"
+        }
+        mock_groq.files.create = AsyncMock(return_value=MagicMock(id="file-in"))
+        mock_groq.batches.create = AsyncMock(
+            return_value=MagicMock(id="batch-1", status="completed", output_file_id="file-out")
+        )
+        output = MagicMock()
+        output.text = AsyncMock(return_value="\n".join([
+            json.dumps({
+                "custom_id": "0:bucket-1",
+                "response": {
+                    "status_code": 200,
+                    "body": {"choices": [{"message": {"content": "Batch suggestion"}}]}
+                },
+                "error": None
+            }),
+            "{not json",
+            json.dumps({"custom_id": "x:bucket-2", "response": {"status_code": 200, "body": {}}}),
+            json.dumps({"custom_id": "7:bucket-9", "response": {"status_code": 200, "body": {}}}),
+            json.dumps({"custom_id": "2:bucket-3", "response": {"status_code": 200, "body": {"choices": []}}})
+        ]))
+        mock_groq.files.content = AsyncMock(return_value=output)
+
+        misconfigurations = [
+            {"type": "Public S3 Bucket", "resource_id": f"bucket-{n}", "details": f"Test {n}"}
+            for n in (1, 2, 3)
+        ]
+
+        results = await get_bulk_suggestions_batch(misconfigurations)
+
+        assert [r["ai_suggestion"] for r in results] == [
+            "Batch suggestion", "Direct suggestion", "Direct suggestion"
+        ]
+        assert mock_get_suggestions.await_count == 2
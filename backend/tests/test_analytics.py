@@ -0,0 +1,97 @@
+import pytest
+from datetime import datetime
+
+from app.analytics import AnalyticsService
+
+class TestAnalytics:
+    """Test cases for scan and remediation analytics"""
+
+    def test_record_scan_updates_dashboard(self):
+        """Test a recorded scan shows up in the dashboard aggregates"""
+        before = AnalyticsService.get_dashboard_metrics(30)
+
+        misconfigurations = [
+            {"type": "Public S3 Bucket", "resource_id": "bucket-1"},
+            {"type": "Unrestricted Security Group", "resource_id": "sg-1"}
+        ]
+        scan_id = AnalyticsService.record_scan("tester", misconfigurations, scan_type="manual")
+
+        after = AnalyticsService.get_dashboard_metrics(30)
+
+        assert after["overview"]["total_scans"] == before["overview"]["total_scans"] + 1
+        assert after["overview"]["total_issues"] == before["overview"]["total_issues"] + 2
+        assert after["recent_scans"][-1]["id"] == scan_id
+
+        s3_before = before["service_breakdown"].get("S3", {"issues": 0})["issues"]
+        assert after["service_breakdown"]["S3"]["issues"] == s3_before + 1
+        assert after["severity_breakdown"]["High"] == before["severity_breakdown"].get("High", 0) + 2
+
+        today = datetime.utcnow().date().isoformat()
+        assert after["time_series"][-1]["date"] == today
+        assert after["time_series"][-1]["scans"] == before["time_series"][-1]["scans"] + 1
+
+    def test_record_remediation_updates_dashboard(self):
+        """Test a recorded remediation is counted in the overview"""
+        before = AnalyticsService.get_dashboard_metrics(30)
+
+        AnalyticsService.record_remediation("admin", "issue-x", "remediated", success=True)
+
+        after = AnalyticsService.get_dashboard_metrics(30)
+        assert after["overview"]["total_remediations"] == before["overview"]["total_remediations"] + 1
+
+    def test_time_series_covers_requested_days(self):
+        """Test the time series has one ordered entry per day in the window"""
+        metrics = AnalyticsService.get_dashboard_metrics(7)
+
+        dates = [entry["date"] for entry in metrics["time_series"]]
+        assert len(dates) == 7
+        assert dates == sorted(dates)
+        assert dates[-1] == datetime.utcnow().date().isoformat()
+
+    @pytest.mark.parametrize("days", [0, -1])
+    def test_empty_window_returns_empty_metrics(self, days):
+        """Test a non-positive window yields empty aggregates instead of an error"""
+        AnalyticsService.record_scan("tester", [{"type": "Public S3 Bucket", "resource_id": "bucket-3"}])
+        
+        metrics = AnalyticsService.get_dashboard_metrics(days)
+        
+        assert metrics["overview"]["total_scans"] == 0
+        assert metrics["overview"]["total_issues"] == 0
+        assert metrics["time_series"] == []
+        assert metrics["recent_scans"] == []
+        assert metrics["top_issues"] == []
+    
+    def test_categorize_by_service_and_severity(self):
+        """Test issues are bucketed by AWS service and severity"""
+        misconfigurations = [
+            {"type": "Public S3 Bucket"},
+            {"type": "Overly Permissive IAM Role"},
+            {"type": "Unrestricted Security Group"},
+            {"type": "Something Else"}
+        ]
+
+        assert AnalyticsService._categorize_by_service(misconfigurations) == {
+            "S3": 1, "IAM": 1, "EC2": 1, "Other": 1
+        }
+        assert AnalyticsService._categorize_by_severity(misconfigurations) == {
+            "High": 2, "Medium": 1, "Low": 1
+        }
+
+    def test_cached_dashboard_etag_tracks_new_data(self):
+        """Test the dashboard ETag is stable until new data is recorded"""
+        etag, metrics = AnalyticsService.get_cached_dashboard_metrics(30)
+        assert metrics is not None
+
+        same_etag, cached = AnalyticsService.get_cached_dashboard_metrics(30)
+        assert same_etag == etag
+        assert cached is metrics
+
+        not_modified_etag, body = AnalyticsService.get_cached_dashboard_metrics(30, if_none_match=etag)
+        assert not_modified_etag == etag
+        assert body is None
+
+        AnalyticsService.record_scan("tester", [{"type": "Public S3 Bucket", "resource_id": "bucket-2"}])
+
+        new_etag, fresh = AnalyticsService.get_cached_dashboard_metrics(30, if_none_match=etag)
+        assert new_etag != etag
+        assert fresh["overview"]["total_scans"] == metrics["overview"]["total_scans"] + 1
@@ -1,12 +1,12 @@
 import pytest
 from fastapi import HTTPException
 from fastapi.security import HTTPAuthorizationCredentials
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 import jwt
-from datetime import datetime, timedelta
+import time
 
 from app.auth import (
-    User, UserRole, authenticate_user, create_access_token,
+    ACCESS_TOKEN_EXPIRE_SECONDS, User, UserRole, MOCK_USERS, authenticate_user, create_access_token,
     verify_token, require_admin, require_authenticated
 )
 
@@ -32,6 +32,29 @@ class TestAuth:
         user = authenticate_user("admin", "wrongpassword")
         assert user is None
     
+    @pytest.mark.parametrize("username", ["admin", "nonexistent"])
+    def test_authenticate_user_password_over_bcrypt_limit(self, username):
+        """Test passwords longer than bcrypt's 72-byte limit are a failed login, not an error"""
+        assert authenticate_user(username, "x" * 80) is None
+    
+    def test_authenticate_user_unknown_username_still_checks_hash(self):
+        """Test unknown usernames go through a bcrypt check like a wrong password"""
+        with patch("app.auth.bcrypt.checkpw", return_value=False) as checkpw:
+            assert authenticate_user("nonexistent", "password") is None
+        
+        checkpw.assert_called_once()
+        assert all("password" not in user_data for user_data in MOCK_USERS.values())
+    
+    def test_authenticate_user_caches_successful_checks(self):
+        """Test repeat logins with the same password skip bcrypt, wrong passwords never do"""
+        assert authenticate_user("security_analyst", "analyst123") is not None
+        
+        with patch("app.auth.bcrypt.checkpw", return_value=False) as checkpw:
+            assert authenticate_user("security_analyst", "analyst123") is not None
+            assert authenticate_user("security_analyst", "wrongpassword") is None
+        
+        checkpw.assert_called_once()
+    
     def test_authenticate_user_viewer_role(self):
         """Test authentication for viewer role"""
         user = authenticate_user("viewer", "viewer123")
@@ -41,31 +64,70 @@ class TestAuth:
         assert user.role == UserRole.VIEWER
         assert user.email == "viewer@company.com"
     
-    def test_create_access_token(self):
+    def test_create_access_token(self, admin_token):
         """Test JWT token creation"""
-        token = create_access_token("testuser", UserRole.ADMIN)
-        
-        assert isinstance(token, str)
-        assert len(token) > 0
+        assert isinstance(admin_token, str)
+        assert len(admin_token) > 0
         
         # Decode and verify token content
         from app.auth import JWT_SECRET, JWT_ALGORITHM
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = jwt.decode(admin_token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         
         assert payload["sub"] == "testuser"
         assert payload["role"] == UserRole.ADMIN.value
         assert "exp" in payload
+        assert isinstance(payload["exp"], int)
+        assert 0 < payload["exp"] - time.time() <= ACCESS_TOKEN_EXPIRE_SECONDS
     
-    def test_verify_token_valid(self):
+    def test_verify_token_valid(self, admin_credentials):
         """Test token verification with valid token"""
-        token = create_access_token("testuser", UserRole.ADMIN)
-        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
-        
-        user = verify_token(credentials)
+        user = verify_token(admin_credentials)
         
         assert user.username == "testuser"
         assert user.role == UserRole.ADMIN
     
+    def test_verify_token_uses_cache_for_repeat_requests(self):
+        """Test a verified token is not decoded again on later requests"""
+        token = create_access_token("cacheduser", UserRole.VIEWER)
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+        
+        first = verify_token(credentials)
+        with patch("app.auth._decode_token") as mock_decode:
+            second = verify_token(credentials)
+        
+        mock_decode.assert_not_called()
+        assert second.username == first.username == "cacheduser"
+        assert second.role == UserRole.VIEWER
+    
+    def test_verify_token_cached_entry_respects_expiry(self, admin_credentials):
+        """Test a cached token is decoded again (and rejected) once past its exp"""
+        verify_token(admin_credentials)
+        
+        with patch("app.auth.time.time", return_value=10**12):
+            with pytest.raises(HTTPException) as exc_info:
+                verify_token(admin_credentials)
+        
+        assert exc_info.value.status_code == 401
+        assert "Token expired" in exc_info.value.detail
+    
+    def test_create_access_token_matches_pyjwt(self, admin_token):
+        """Test tokens are byte-for-byte what PyJWT produces for the same payload"""
+        from app.auth import JWT_SECRET, JWT_ALGORITHM
+        payload = jwt.decode(admin_token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        
+        assert admin_token == jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    
+    def test_verify_token_tampered_signature(self):
+        """Test a token signed with a different secret is rejected"""
+        token = jwt.encode({"sub": "admin", "role": "admin"}, "a-different-secret-that-is-long-enough", algorithm="HS256")
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+        
+        with pytest.raises(HTTPException) as exc_info:
+            verify_token(credentials)
+        
+        assert exc_info.value.status_code == 401
+        assert "Invalid token" in exc_info.value.detail
+    
     def test_verify_token_invalid(self):
         """Test token verification with invalid token"""
         credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials="invalid-token")
@@ -76,20 +138,10 @@ class TestAuth:
         assert exc_info.value.status_code == 401
         assert "Invalid token" in exc_info.value.detail
     
-    def test_verify_token_expired(self):
+    def test_verify_token_expired(self, expired_credentials):
         """Test token verification with expired token"""
-        # Create an expired token
-        from app.auth import JWT_SECRET, JWT_ALGORITHM
-        payload = {
-            "sub": "testuser",
-            "role": UserRole.ADMIN.value,
-            "exp": datetime.utcnow() - timedelta(hours=1)  # Expired 1 hour ago
-        }
-        expired_token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
-        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=expired_token)
-        
         with pytest.raises(HTTPException) as exc_info:
-            verify_token(credentials)
+            verify_token(expired_credentials)
         
         assert exc_info.value.status_code == 401
         assert "Token expired" in exc_info.value.detail
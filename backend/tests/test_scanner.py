@@ -1,12 +1,43 @@
 import pytest
+from unittest.mock import patch, MagicMock
+from botocore.exceptions import ClientError
 from app.scanner import (
     find_public_s3_buckets,
     find_permissive_iam_roles,
     find_unrestricted_security_groups,
     scan_all,
-    scan_with_credentials
+    scan_with_credentials,
+    _cached_client,
+    _client,
+    _scan_cache,
+    invalidate_scan_cache,
+    _session
 )
 
+def paginate(client, pages_by_operation):
+    """Make client.get_paginator(op).paginate(...) yield the given pages"""
+    def get_paginator(operation):
+        paginator = MagicMock()
+        paginator.paginate.side_effect = lambda **kwargs: iter(pages_by_operation[operation](**kwargs))
+        return paginator
+    client.get_paginator.side_effect = get_paginator
+
+@pytest.fixture
+def empty_scan_cache():
+    """Make scan_with_credentials really scan instead of reusing earlier results"""
+    _scan_cache.clear()
+    yield
+    _scan_cache.clear()
+
+@pytest.fixture(scope="module")
+def mock_scan_result():
+    """Findings for a scan without usable credentials, computed once for the module"""
+    _scan_cache.clear()
+    try:
+        return scan_with_credentials("", "", "us-east-1")
+    finally:
+        _scan_cache.clear()
+
 class TestScanner:
     """Test cases for cloud security scanner"""
     
@@ -49,19 +80,26 @@ class TestScanner:
         assert "Overly Permissive IAM Role" in types
         assert "Unrestricted Security Group" in types
     
-    def test_scan_with_invalid_credentials(self):
-        """Test scanning with invalid credentials returns mock data"""
-        result = scan_with_credentials("invalid", "invalid", "us-east-1")
-        
-        assert len(result) == 3
-        for item in result:
+    def test_mock_scan_result_is_mock_data(self, mock_scan_result):
+        """Test scanning with empty credentials returns mock data"""
+        assert len(mock_scan_result) == 3
+        for item in mock_scan_result:
             assert "mock data" in item["details"]
     
-    def test_scan_with_empty_credentials(self):
-        """Test scanning with empty credentials returns mock data"""
-        result = scan_with_credentials("", "", "us-east-1")
+    @pytest.mark.parametrize("credentials", [("invalid", "invalid"), ("", "")], ids=["invalid", "empty"])
+    @patch('app.scanner._client')
+    def test_scan_with_invalid_credentials(self, mock_client, credentials, mock_scan_result, empty_scan_cache):
+        """Test scanning with invalid or empty credentials returns the same mock findings"""
+        mock_client.side_effect = ClientError(
+            {"Error": {"Code": "InvalidClientTokenId"}}, "ListBuckets"
+        )
+        result = scan_with_credentials(*credentials, "us-east-1")
         
-        assert len(result) == 3
+        # Invalid credentials reach AWS and are rejected; empty ones never do
+        assert mock_client.call_count == (3 if credentials[0] else 0)
+        assert [(item["type"], item["resource_id"]) for item in result] == [
+            (item["type"], item["resource_id"]) for item in mock_scan_result
+        ]
         for item in result:
             assert "mock data" in item["details"]
     
@@ -75,4 +113,202 @@ class TestScanner:
             assert "details" in item
             assert isinstance(item["type"], str)
             assert isinstance(item["resource_id"], str)
-            assert isinstance(item["details"], str)
\ No newline at end of file
+            assert isinstance(item["details"], str)
+    
+    @patch('app.scanner._client')
+    def test_scan_all_ignores_environment_credentials(self, mock_client, monkeypatch):
+        """Test full scan stays mock-only even when AWS credentials are in the environment"""
+        monkeypatch.setenv("AWS_ACCESS_KEY_ID", "AKIAENV")
+        monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "env-secret")
+        
+        result = scan_all()
+        
+        assert len(result) == 3
+        mock_client.assert_not_called()
+    
+    @patch('app.scanner._run_concurrently')
+    def test_scan_with_credentials_reuses_recent_results(self, mock_run):
+        """Test repeat scans with the same credentials are served from the cache until invalidated"""
+        _scan_cache.clear()
+        mock_run.return_value = [{"type": "Public S3 Bucket", "resource_id": "bucket-1", "details": "Public"}]
+        try:
+            first = scan_with_credentials("AKIACACHE", "secret", "us-east-1")
+            first[0]["details"] = "mutated by caller"
+            second = scan_with_credentials("AKIACACHE", "secret", "us-east-1")
+            
+            assert mock_run.call_count == 1
+            assert second[0]["details"] == "Public"
+            
+            # A different secret or region is a different cache entry
+            scan_with_credentials("AKIACACHE", "other-secret", "us-east-1")
+            scan_with_credentials("AKIACACHE", "secret", "eu-west-1")
+            assert mock_run.call_count == 3
+            
+            invalidate_scan_cache("AKIACACHE", "secret", "us-east-1")
+            scan_with_credentials("AKIACACHE", "secret", "us-east-1")
+            assert mock_run.call_count == 4
+        finally:
+            _scan_cache.clear()
+    
+    @patch('app.scanner.boto3.session.Session')
+    def test_client_is_reused_for_same_credentials(self, mock_session_cls):
+        """Test boto3 sessions and clients are built once per credentials and region"""
+        _session.cache_clear()
+        _cached_client.cache_clear()
+        try:
+            s3 = _client('s3', 'AKIAREUSE', 'secret', 'us-east-1')
+            assert _client('s3', 'AKIAREUSE', 'secret', 'us-east-1') is s3
+            _client('iam', 'AKIAREUSE', 'secret', 'us-east-1')
+            _client('s3', 'AKIAOTHER', 'secret', 'us-east-1')
+            
+            assert mock_session_cls.call_count == 2
+            assert mock_session_cls.return_value.client.call_count == 3
+        finally:
+            _session.cache_clear()
+            _cached_client.cache_clear()
+    
+    @patch('app.scanner._client')
+    def test_find_public_s3_buckets_inspects_each_bucket(self, mock_client):
+        """Test S3 scanning flags public buckets across all listed buckets"""
+        s3 = mock_client.return_value
+        paginate(s3, {"list_buckets": lambda **kwargs: [
+            {"Buckets": [{"Name": "public-bucket"}]},
+            {"Buckets": [{"Name": "private-bucket"}]}
+        ]})
+        
+        def get_bucket_acl(Bucket):
+            uri = "http://acs.amazonaws.com/groups/global/AllUsers" if Bucket == "public-bucket" else "owner"
+            return {"Grants": [{"Grantee": {"URI": uri}}]}
+        
+        s3.get_public_access_block.return_value = {"PublicAccessBlockConfiguration": {}}
+        s3.get_bucket_acl.side_effect = get_bucket_acl
+        s3.get_bucket_policy_status.side_effect = lambda Bucket: {
+            "PolicyStatus": {"IsPublic": Bucket == "private-bucket"}
+        }
+        
+        result = find_public_s3_buckets("AKIA", "secret")
+        
+        assert [(item["resource_id"], item["type"]) for item in result] == [
+            ("public-bucket", "Public S3 Bucket"),
+            ("private-bucket", "Public S3 Bucket Policy")
+        ]
+        assert s3.get_bucket_acl.call_count == 2
+    
+    @patch('app.scanner._client')
+    def test_find_public_s3_buckets_skips_fully_blocked_buckets(self, mock_client):
+        """Test buckets with every public access block flag set need no further calls"""
+        s3 = mock_client.return_value
+        paginate(s3, {"list_buckets": lambda **kwargs: [{"Buckets": [{"Name": "locked-bucket"}]}]})
+        s3.get_public_access_block.return_value = {"PublicAccessBlockConfiguration": {
+            "BlockPublicAcls": True,
+            "IgnorePublicAcls": True,
+            "BlockPublicPolicy": True,
+            "RestrictPublicBuckets": True
+        }}
+        
+        result = find_public_s3_buckets("AKIA", "secret")
+        
+        assert result == []
+        s3.get_bucket_acl.assert_not_called()
+        s3.get_bucket_policy_status.assert_not_called()
+    
+    @patch('app.scanner._client')
+    def test_find_public_s3_buckets_parses_policy_without_policy_status(self, mock_client):
+        """Test the bucket policy is parsed structurally when policy status is unavailable"""
+        s3 = mock_client.return_value
+        paginate(s3, {"list_buckets": lambda **kwargs: [{"Buckets": [{"Name": "compact-policy-bucket"}]}]})
+        s3.get_public_access_block.return_value = {"PublicAccessBlockConfiguration": {"IgnorePublicAcls": True}}
+        s3.get_bucket_policy_status.side_effect = ClientError(
+            {"Error": {"Code": "AccessDenied"}}, "GetBucketPolicyStatus"
+        )
+        # No whitespace around the principal, which a substring check would miss
+        s3.get_bucket_policy.return_value = {
+            "Policy": '{"Statement":[{"Effect":"Allow","Principal":{"AWS":"*"},"Action":"s3:GetObject"}]}'
+        }
+        
+        result = find_public_s3_buckets("AKIA", "secret")
+        
+        assert len(result) == 1
+        assert result[0]["type"] == "Public S3 Bucket Policy"
+    
+    @patch('app.scanner._client')
+    def test_find_permissive_iam_roles_flags_admin_policies(self, mock_client):
+        """Test IAM scanning flags roles with Allow */* policies"""
+        iam = mock_client.return_value
+        paginate(iam, {
+            "list_policies": lambda **kwargs: [{"Policies": [
+                {"Arn": "arn:aws:iam::123:policy/admin-role", "DefaultVersionId": "v2"},
+                {"Arn": "arn:aws:iam::123:policy/read-role", "DefaultVersionId": "v1"}
+            ]}],
+            "list_roles": lambda **kwargs: [
+                {"Roles": [{"RoleName": "admin-role"}]},
+                {"Roles": [{"RoleName": "read-role"}, {"RoleName": "other-admin-role"}]}
+            ],
+            "list_attached_role_policies": lambda RoleName, **kwargs: [{"AttachedPolicies": [{
+                "PolicyName": f"{RoleName}-policy",
+                # Both admin roles share one policy
+                "PolicyArn": "arn:aws:iam::123:policy/" + ("read-role" if RoleName == "read-role" else "admin-role")
+            }]}]
+        })
+        
+        def get_policy_version(PolicyArn, VersionId):
+            action = "*" if PolicyArn.endswith("admin-role") else "s3:GetObject"
+            return {"PolicyVersion": {"Document": {
+                "Statement": {"Effect": "Allow", "Action": action, "Resource": "*"}
+            }}}
+        
+        iam.get_policy_version.side_effect = get_policy_version
+        
+        result = find_permissive_iam_roles("AKIA", "secret")
+        
+        assert [item["resource_id"] for item in result] == ["admin-role", "other-admin-role"]
+        assert "admin-role-policy" in result[0]["details"]
+        # One document fetch per policy, using the default version from list_policies
+        assert iam.get_policy_version.call_count == 2
+        iam.get_policy.assert_not_called()
+    
+    @patch('app.scanner._client')
+    def test_find_permissive_iam_roles_without_list_policies_permission(self, mock_client):
+        """Test an AccessDenied on list_policies falls back to per-policy get_policy lookups"""
+        iam = mock_client.return_value
+        
+        def list_policies(**kwargs):
+            raise ClientError({"Error": {"Code": "AccessDenied"}}, "ListPolicies")
+        
+        paginate(iam, {
+            "list_policies": list_policies,
+            "list_roles": lambda **kwargs: [{"Roles": [{"RoleName": "admin-role"}]}],
+            "list_attached_role_policies": lambda RoleName, **kwargs: [{"AttachedPolicies": [{
+                "PolicyName": "admin-policy",
+                "PolicyArn": "arn:aws:iam::123:policy/admin-policy"
+            }]}]
+        })
+        iam.get_policy.return_value = {"Policy": {"DefaultVersionId": "v3"}}
+        iam.get_policy_version.return_value = {"PolicyVersion": {"Document": {
+            "Statement": {"Effect": "Allow", "Action": "*", "Resource": "*"}
+        }}}
+        
+        result = find_permissive_iam_roles("AKIA", "secret")
+        
+        assert [item["resource_id"] for item in result] == ["admin-role"]
+        iam.get_policy_version.assert_called_once_with(
+            PolicyArn="arn:aws:iam::123:policy/admin-policy", VersionId="v3"
+        )
+    
+    @patch('app.scanner._client')
+    def test_find_unrestricted_security_groups_reads_every_page(self, mock_client):
+        """Test security group scanning covers all describe_security_groups pages"""
+        ec2 = mock_client.return_value
+        open_rule = {"FromPort": 22, "IpRanges": [{"CidrIp": "0.0.0.0/0"}]}
+        paginate(ec2, {"describe_security_groups": lambda **kwargs: [
+            {"SecurityGroups": [{"GroupId": "sg-1", "IpPermissions": [open_rule]}]},
+            {"SecurityGroups": [
+                {"GroupId": "sg-2", "IpPermissions": [{"IpRanges": [{"CidrIp": "10.0.0.0/8"}]}]},
+                {"GroupId": "sg-3", "IpPermissions": [open_rule]}
+            ]}
+        ]})
+        
+        result = find_unrestricted_security_groups("AKIA", "secret")
+        
+        assert [item["resource_id"] for item in result] == ["sg-1", "sg-3"]
+        assert "port 22" in result[0]["details"]